@@ -0,0 +1,144 @@
+import time
+from collections import defaultdict
+
+from config import config
+
+
+class DeltaPipeline:
+    # Stands in for a Redis pipeline while a commit's stats are queued and
+    # merges every increment of the same key and field, so a commit sends one
+    # command per touched field instead of one per order.
+    def __init__(self):
+        self.int_fields = defaultdict(lambda: defaultdict(int))
+        self.float_fields = defaultdict(lambda: defaultdict(float))
+        self.scores = defaultdict(lambda: defaultdict(float))
+        self.members = defaultdict(set)
+        self.hll_members = defaultdict(set)
+        self.rank_trims = {}
+        self.expirations = {}
+        self.messages = []
+
+    def hincrby(self, key: str, field: str, amount: int = 1):
+        self.int_fields[key][field] += amount
+
+    def hincrbyfloat(self, key: str, field: str, amount: float = 1.0):
+        self.float_fields[key][field] += amount
+
+    def zincrby(self, key: str, amount: float, member: str):
+        self.scores[key][member] += amount
+
+    def sadd(self, key: str, *members):
+        self.members[key].update(members)
+
+    def pfadd(self, key: str, *members):
+        self.hll_members[key].update(members)
+
+    def zremrangebyrank(self, key: str, start: int, end: int):
+        self.rank_trims[key] = (start, end)
+
+    def expire(self, key: str, seconds: int):
+        self.expirations[key] = seconds
+
+    def publish(self, channel: str, message: str):
+        self.messages.append((channel, message))
+
+    def apply(self, pipe):
+        for key, fields in self.int_fields.items():
+            for field, amount in fields.items():
+                pipe.hincrby(key, field, amount)
+        for key, fields in self.float_fields.items():
+            for field, amount in fields.items():
+                pipe.hincrbyfloat(key, field, amount)
+        for key, scores in self.scores.items():
+            # Zero deltas are kept on purpose: they add the member to the
+            # ranking, like the failed-order increments they came from.
+            for member, amount in scores.items():
+                pipe.zincrby(key, amount, member)
+        for key, (start, end) in self.rank_trims.items():
+            pipe.zremrangebyrank(key, start, end)
+        for key, members in self.members.items():
+            pipe.sadd(key, *members)
+        for key, members in self.hll_members.items():
+            pipe.pfadd(key, *members)
+        # After the increments, so the keys exist when their TTL is set.
+        for key, seconds in self.expirations.items():
+            pipe.expire(key, seconds)
+        for channel, message in self.messages:
+            pipe.publish(channel, message)
+
+
+class AggregationBuffer:
+    # Holds parsed orders across received batches until
+    # AGGREGATION_FLUSH_MESSAGES are pending or the oldest has waited
+    # AGGREGATION_FLUSH_INTERVAL_MS, so one commit covers many batches. The
+    # buffered messages are only acked after that commit succeeds.
+    def __init__(self):
+        self.max_messages = max(1, config.AGGREGATION_FLUSH_MESSAGES)
+        self.flush_interval = config.AGGREGATION_FLUSH_INTERVAL_MS / 1000
+        self.pending = []
+        self.tokens = []
+        self.oldest_pending_at = None
+
+    def add(self, pending: list, token=None):
+        if not self.pending and not self.tokens:
+            self.oldest_pending_at = time.monotonic()
+        self.pending += pending
+        self.tokens.append(token)
+
+    def time_until_due(self):
+        if self.oldest_pending_at is None:
+            return self.flush_interval
+        elapsed = time.monotonic() - self.oldest_pending_at
+        return max(0.0, self.flush_interval - elapsed)
+
+    def is_due(self):
+        if self.oldest_pending_at is None:
+            return False
+        return len(self.pending) >= self.max_messages or self.time_until_due() == 0
+
+    def take(self):
+        pending, self.pending = self.pending, []
+        tokens, self.tokens = self.tokens, []
+        self.oldest_pending_at = None
+        return pending, tokens
+
+
+class OrderTotals:
+    __slots__ = ("order_count", "total_spend", "failed_order_count")
+
+    def __init__(self):
+        self.order_count = 0
+        self.total_spend = 0.0
+        self.failed_order_count = 0
+
+    def add(self, order_value: float, is_failed: bool):
+        if is_failed:
+            self.failed_order_count += 1
+        else:
+            self.order_count += 1
+            self.total_spend += order_value
+
+    def merge(self, other: "OrderTotals"):
+        self.order_count += other.order_count
+        self.total_spend += other.total_spend
+        self.failed_order_count += other.failed_order_count
+
+
+def group_order_stats(rows: list):
+    # Folds (user_id, order_value, month_key, hour_key, is_failed) rows into
+    # totals per (user, month), per hour and overall in a single pass, so
+    # stats are queued once per group instead of once per order.
+    groups = {}
+    hourly = {}
+    overall = OrderTotals()
+    for user_id, order_value, month_key, hour_key, is_failed in rows:
+        totals = groups.get((user_id, month_key))
+        if totals is None:
+            totals = groups[(user_id, month_key)] = OrderTotals()
+        totals.add(order_value, is_failed)
+        totals = hourly.get(hour_key)
+        if totals is None:
+            totals = hourly[hour_key] = OrderTotals()
+        totals.add(order_value, is_failed)
+        overall.add(order_value, is_failed)
+    return groups, hourly, overall
@@ -1,12 +1,49 @@
-from consumer import consumer
-from fastapi import APIRouter
-from fastapi.responses import JSONResponse
-from logger import read_last_n_logs
+import json
+from datetime import datetime, timezone
+from typing import Optional
+
+from cache import response_cache, serve_cached
+from archive import list_segments
+from config import config
+from dlq import dead_letter_queue
+from fastapi import APIRouter, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from jobs import JOB_FINISHED, ProduceJob, produce_jobs
+from logger import LogTailReader, parse_log_time
+from metrics import QueueDepthCollector, render_metrics
+from prometheus_client import CONTENT_TYPE_LATEST
 from producer import producer
-from schema import ProduceRequest
+from redis_pool import get_async_redis, pool_stats
+from rollups import (
+    bucket_labels,
+    parse_timestamp,
+    queryable_granularities,
+    rollup_key,
+)
+from replay import ReplayJob, has_replay_keys, replay_jobs
+from schema import (
+    ProduceJobRequest,
+    ProduceRequest,
+    ReplayRequest,
+    UserStatsRequest,
+)
+from sketches import (
+    SKETCH_DIMENSIONS,
+    cms_cells,
+    cms_estimate,
+    estimate_quantiles,
+    sketch_key,
+)
+from supervisor import supervisor
 
 api_router = APIRouter(tags=["API"])
 
+MONTHLY_STATS_MAX_LIMIT = 1000
+CONSUMER_LOGS_MAX_LIMIT = 1000
+
+queue_depth_collector = QueueDepthCollector(dead_letter_queue.queue_depths)
+
 
 @api_router.get("/api")
 async def api_info():
@@ -17,25 +54,84 @@ async def api_info():
             "message": "SQS Order Management API",
             "endpoints": {
                 "produce": "POST /produce - Send random orders to queue",
-                "consumer_logs": "GET /consumer_logs - Get latest 100 consumer logs",
+                "produce/jobs": "POST /produce/jobs - Start a background produce job at a target rate (GET to list, GET/DELETE /produce/jobs/{job_id} for status/cancel)",
+                "produce/jobs/{job_id}/events": "GET /produce/jobs/{job_id}/events - Stream job progress as NDJSON, or SSE with Accept: text/event-stream",
+                "consumer_logs": "GET /consumer_logs - Get latest consumer logs (cursor pagination, filters: level, user_id, order_id, since, until)",
+                "health/live": "GET /health/live - Liveness probe, 200 as soon as the API serves requests",
+                "health/ready": "GET /health/ready - Readiness probe, 503 until Redis, SQS and the consumer workers are up",
+                "consumers": "GET /consumers - Get consumer worker liveness and throughput",
+                "metrics": "GET /metrics - Prometheus metrics from the API and every consumer worker",
+                "dlq": "GET /dlq - Inspect messages in the dead-letter queue",
+                "dlq/replay": "POST /dlq/replay - Move dead-lettered messages back onto the orders queue",
+                "archive": "GET /archive - Get the order archive's segments and size",
+                "replay/jobs": "POST /replay/jobs - Rebuild Redis aggregates from the order archive (GET to list, GET/DELETE /replay/jobs/{job_id} for status/cancel)",
+                "replay/jobs/{job_id}/events": "GET /replay/jobs/{job_id}/events - Stream replay progress as NDJSON, or SSE with Accept: text/event-stream",
                 "delete_redis_db": "DELETE /delete_redis_db - Delete Redis database",
-                "users": "GET /users - Get user ranking",
+                "redis_pools": "GET /redis/pools - Get Redis connection pool utilization",
+                "cache": "GET /cache - Get stats response cache hit/miss counters",
+                "users": "GET /users - Get user ranking (cursor pagination, expand=stats for per-user stats)",
+                "users/stats": "POST /users/stats - Get stats for a list of users in one request",
                 "users/{user_id}/stats": "GET /users/{user_id}/stats - Get user stats",
                 "stats/global": "GET /stats/global - Get global stats",
-                "stats/monthly/{month}": "GET /stats/monthly/{month} - Get monthly stats (format: YYYY-MM)",
+                "stats/monthly/{month}": "GET /stats/monthly/{month} - Get monthly stats (format: YYYY-MM, paginated with limit/offset)",
+                "stats/unique/{month}": "GET /stats/unique/{month} - Get approximate unique users and orders (format: YYYY-MM)",
+                "stats/top/{month}": "GET /stats/top/{month} - Get approximate top products or payment methods (dimension, k)",
+                "stats/quantiles/{month}": "GET /stats/quantiles/{month} - Get approximate order value quantiles (q, repeatable)",
+                "stats/range": "GET /stats/range - Get order totals as a time series (from, to, granularity: hour, day or month)",
             },
         },
     )
 
 
+@api_router.get("/health/live")
+async def liveness():
+    return JSONResponse(status_code=200, content={"status": "ok"})
+
+
+@api_router.get("/health/ready")
+async def readiness():
+    # Every check reports "ok" or why it is not ready. SQS counts as up once
+    # startup has resolved the queue URLs; probes never wait on SQS retries.
+    checks = {}
+    try:
+        await get_async_redis().ping()
+        checks["redis"] = "ok"
+    except Exception as e:
+        checks["redis"] = str(e)
+
+    checks["sqs"] = "ok" if dead_letter_queue.dlq_url else "connecting"
+
+    workers = supervisor.status()
+    alive = sum(1 for worker in workers if worker["alive"])
+    if supervisor.paused.is_set():
+        # Drained on purpose for a replay, resumed when it finishes.
+        checks["consumers"] = "ok"
+    elif not workers:
+        checks["consumers"] = "starting"
+    elif alive:
+        checks["consumers"] = "ok"
+    else:
+        checks["consumers"] = f"0 of {len(workers)} workers alive"
+
+    ready = all(check == "ok" for check in checks.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "not_ready", "checks": checks},
+    )
+
+
 @api_router.post("/produce")
 async def produce_orders(request: ProduceRequest):
     try:
-        sent_orders = producer.send_orders_to_queue(request.count)
+        sent_orders = await run_in_threadpool(
+            producer.send_orders_to_queue, request.count
+        )
+        failed_count = sum(1 for order in sent_orders if order["status"] == "failed")
         return JSONResponse(
             status_code=200,
             content={
-                "message": f"Successfully sent {request.count} orders to queue",
+                "message": f"Successfully sent {request.count - failed_count} orders to queue",
+                "failed_count": failed_count,
                 "orders": sent_orders,
             },
         )
@@ -46,22 +142,267 @@ async def produce_orders(request: ProduceRequest):
         )
 
 
+@api_router.post("/produce/jobs")
+async def start_produce_job(request: ProduceJobRequest):
+    rate = config.PRODUCE_JOB_DEFAULT_RATE if request.rate is None else request.rate
+    try:
+        job = produce_jobs.start(ProduceJob(request.count, rate))
+    except RuntimeError as e:
+        return JSONResponse(status_code=429, content={"error": str(e)})
+
+    return JSONResponse(
+        status_code=202,
+        content={**job.snapshot(), "events": f"/produce/jobs/{job.job_id}/events"},
+    )
+
+
+@api_router.get("/produce/jobs")
+async def list_produce_jobs():
+    jobs = [job.snapshot() for job in produce_jobs.jobs.values()]
+    return JSONResponse(status_code=200, content={"jobs": jobs})
+
+
+@api_router.get("/produce/jobs/{job_id}")
+async def get_produce_job(job_id: str):
+    job = produce_jobs.get(job_id)
+    if not job:
+        return JSONResponse(
+            status_code=404,
+            content={"error": f"Produce job {job_id} not found"},
+        )
+    return JSONResponse(status_code=200, content=job.snapshot())
+
+
+@api_router.delete("/produce/jobs/{job_id}")
+async def cancel_produce_job(job_id: str):
+    job = produce_jobs.cancel(job_id)
+    if not job:
+        return JSONResponse(
+            status_code=404,
+            content={"error": f"Produce job {job_id} not found"},
+        )
+    return JSONResponse(status_code=202, content=job.snapshot())
+
+
+async def stream_job_ndjson(job):
+    async for snapshot in job.updates():
+        yield json.dumps(snapshot) + "\n"
+
+
+async def stream_job_sse(job):
+    async for snapshot in job.updates():
+        event = "done" if snapshot["status"] in JOB_FINISHED else "progress"
+        yield f"event: {event}\ndata: {json.dumps(snapshot)}\n\n"
+
+
+def stream_job(request: Request, job, format: Optional[str]):
+    if format == "sse" or (
+        format is None and "text/event-stream" in request.headers.get("accept", "")
+    ):
+        return StreamingResponse(
+            stream_job_sse(job),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache"},
+        )
+    return StreamingResponse(stream_job_ndjson(job), media_type="application/x-ndjson")
+
+
+@api_router.get("/produce/jobs/{job_id}/events")
+async def stream_produce_job(
+    request: Request, job_id: str, format: Optional[str] = None
+):
+    job = produce_jobs.get(job_id)
+    if not job:
+        return JSONResponse(
+            status_code=404,
+            content={"error": f"Produce job {job_id} not found"},
+        )
+    return stream_job(request, job, format)
+
+
+@api_router.get("/archive")
+async def get_archive():
+    try:
+        segments = await run_in_threadpool(list_segments)
+        return JSONResponse(
+            status_code=200,
+            content={
+                "enabled": config.ARCHIVE_ENABLED,
+                "directory": config.ARCHIVE_DIR,
+                "segments": len(segments),
+                "bytes": sum(size for _, size in segments),
+            },
+        )
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+
+@api_router.post("/replay/jobs")
+async def start_replay_job(request: ReplayRequest):
+    if not request.clear and await has_replay_keys(get_async_redis()):
+        return JSONResponse(
+            status_code=409,
+            content={
+                "error": "Redis already holds aggregates, replaying on top would count the archive twice; use clear=true"
+            },
+        )
+    try:
+        job = replay_jobs.start(ReplayJob(request.clear))
+    except RuntimeError as e:
+        return JSONResponse(status_code=409, content={"error": str(e)})
+
+    return JSONResponse(
+        status_code=202,
+        content={**job.snapshot(), "events": f"/replay/jobs/{job.job_id}/events"},
+    )
+
+
+@api_router.get("/replay/jobs")
+async def list_replay_jobs():
+    jobs = [job.snapshot() for job in replay_jobs.jobs.values()]
+    return JSONResponse(status_code=200, content={"jobs": jobs})
+
+
+@api_router.get("/replay/jobs/{job_id}")
+async def get_replay_job(job_id: str):
+    job = replay_jobs.get(job_id)
+    if not job:
+        return JSONResponse(
+            status_code=404,
+            content={"error": f"Replay job {job_id} not found"},
+        )
+    return JSONResponse(status_code=200, content=job.snapshot())
+
+
+@api_router.delete("/replay/jobs/{job_id}")
+async def cancel_replay_job(job_id: str):
+    job = replay_jobs.cancel(job_id)
+    if not job:
+        return JSONResponse(
+            status_code=404,
+            content={"error": f"Replay job {job_id} not found"},
+        )
+    return JSONResponse(status_code=202, content=job.snapshot())
+
+
+@api_router.get("/replay/jobs/{job_id}/events")
+async def stream_replay_job(
+    request: Request, job_id: str, format: Optional[str] = None
+):
+    job = replay_jobs.get(job_id)
+    if not job:
+        return JSONResponse(
+            status_code=404,
+            content={"error": f"Replay job {job_id} not found"},
+        )
+    return stream_job(request, job, format)
+
+
+def stream_log_page(reader: LogTailReader):
+    yield '{"logs": ['
+    total_logs = 0
+    for entry in reader:
+        yield ("," if total_logs else "") + json.dumps(entry)
+        total_logs += 1
+    yield f'], "total_logs": {total_logs}, "next_cursor": {json.dumps(reader.next_cursor)}}}'
+
+
 @api_router.get("/consumer_logs")
-async def get_consumer_logs():
-    logs = read_last_n_logs(100)
+async def get_consumer_logs(
+    limit: int = Query(100, ge=1, le=CONSUMER_LOGS_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    level: Optional[str] = None,
+    user_id: Optional[str] = None,
+    order_id: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+):
+    try:
+        since_time = parse_log_time(since) if since else None
+        until_time = parse_log_time(until) if until else None
+    except ValueError:
+        return JSONResponse(
+            status_code=400,
+            content={"error": "Invalid since/until, expected YYYY-MM-DD HH:MM:SS"},
+        )
+    if since_time and until_time and since_time > until_time:
+        return JSONResponse(
+            status_code=400,
+            content={"error": "since must not be after until"},
+        )
+
+    try:
+        reader = LogTailReader(
+            limit, cursor, level, user_id, order_id, since_time, until_time
+        )
+    except ValueError:
+        return JSONResponse(
+            status_code=400,
+            content={"error": f"Invalid cursor: {cursor}"},
+        )
+
+    return StreamingResponse(stream_log_page(reader), media_type="application/json")
+
+
+@api_router.get("/consumers")
+async def get_consumers():
+    workers = supervisor.status()
     return JSONResponse(
         status_code=200,
         content={
-            "total_logs": len(logs),
-            "logs": logs,
+            "total_workers": len(workers),
+            "alive_workers": sum(1 for worker in workers if worker["alive"]),
+            "paused": supervisor.paused.is_set(),
+            "workers": workers,
         },
     )
 
 
+@api_router.get("/metrics")
+async def get_metrics():
+    try:
+        # Reads every process's sample files and the queue depths from SQS,
+        # so it runs off the event loop.
+        body = await run_in_threadpool(render_metrics, queue_depth_collector)
+        return Response(content=body, media_type=CONTENT_TYPE_LATEST)
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"error": str(e)},
+        )
+
+
+@api_router.get("/dlq")
+async def inspect_dead_letter_queue(limit: int = 10):
+    try:
+        content = await run_in_threadpool(dead_letter_queue.inspect, limit)
+        return JSONResponse(status_code=200, content=content)
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"error": str(e)},
+        )
+
+
+@api_router.post("/dlq/replay")
+async def replay_dead_letter_queue(limit: int = 100):
+    try:
+        content = await run_in_threadpool(dead_letter_queue.replay, limit)
+        return JSONResponse(status_code=200, content=content)
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"error": str(e)},
+        )
+
+
 @api_router.delete("/clear_redis_db")
 async def delete_redis_db():
     try:
-        consumer.get_redis_client().flushdb()
+        redis_client = get_async_redis()
+        await redis_client.flushdb()
+        response_cache.invalidate()
+        await redis_client.publish(config.STATS_INVALIDATION_CHANNEL, "flushdb")
         return JSONResponse(
             status_code=200,
             content={"message": "Redis database cleared"},
@@ -73,37 +414,158 @@ async def delete_redis_db():
         )
 
 
+@api_router.get("/redis/pools")
+async def get_redis_pools():
+    return JSONResponse(status_code=200, content=pool_stats())
+
+
+@api_router.get("/cache")
+async def get_cache_stats():
+    return JSONResponse(status_code=200, content=response_cache.stats())
+
+
+def describe_user_stats(user_id: str, user_stats: dict):
+    order_count = user_stats.get(b"order_count")
+    total_spend = user_stats.get(b"total_spend")
+    failed_order_count = user_stats.get(b"failed_order_count")
+
+    return {
+        "user_id": user_id,
+        "order_count": int(order_count) if order_count else 0,
+        "total_spend": float(total_spend) if total_spend else 0.0,
+        "failed_order_count": int(failed_order_count) if failed_order_count else 0,
+    }
+
+
+async def fetch_user_stats(redis_client, user_ids: list):
+    # One pipelined HGETALL per user, so any number of users costs a single
+    # round trip. Users without a stats hash map to None.
+    if not user_ids:
+        return {}
+
+    pipe = redis_client.pipeline(transaction=False)
+    for user_id in user_ids:
+        pipe.hgetall(f"user:{user_id}")
+    user_hashes = await pipe.execute()
+
+    return {
+        user_id: describe_user_stats(user_id, user_stats) if user_stats else None
+        for user_id, user_stats in zip(user_ids, user_hashes)
+    }
+
+
+def parse_ranking_cursor(cursor: Optional[str]):
+    # The cursor is the rank the next page starts at. ZREVRANGE seeks by
+    # rank in O(log N), so deep pages cost the same as the first one.
+    if cursor is None:
+        return 0
+    offset = int(cursor)
+    if offset < 0:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return offset
+
+
 @api_router.get("/users")
-async def get_user_ranking(limit: int = 10):
+async def get_user_ranking(
+    request: Request,
+    limit: int = Query(10, ge=1),
+    cursor: Optional[str] = None,
+    expand: Optional[str] = None,
+):
+    try:
+        offset = parse_ranking_cursor(cursor)
+    except ValueError:
+        return JSONResponse(
+            status_code=400,
+            content={"error": f"Invalid cursor: {cursor}"},
+        )
+    if expand not in (None, "stats"):
+        return JSONResponse(
+            status_code=400,
+            content={"error": f"Unsupported expand: {expand}, expected stats"},
+        )
+
+    return await serve_cached(
+        request,
+        f"users:{limit}:{offset}:{expand}",
+        lambda: load_user_ranking(limit, offset, expand == "stats"),
+    )
+
+
+async def load_user_ranking(limit: int, offset: int, with_stats: bool):
     try:
-        redis_client = consumer.get_redis_client()
+        redis_client = get_async_redis()
 
-        spend_results = redis_client.zrevrange(
-            "user_ranking:total_spend", 0, limit - 1, withscores=True
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.zrevrange(
+            "user_ranking:total_spend", offset, offset + limit - 1, withscores=True
         )
-        orders_results = redis_client.zrevrange(
-            "user_ranking:total_order_count", 0, limit - 1, withscores=True
+        pipe.zrevrange(
+            "user_ranking:total_order_count",
+            offset,
+            offset + limit - 1,
+            withscores=True,
         )
+        spend_results, orders_results = await pipe.execute()
+
+        user_stats = {}
+        if with_stats:
+            user_ids = dict.fromkeys(
+                user_id.decode("utf-8")
+                for user_id, _ in spend_results + orders_results
+            )
+            user_stats = await fetch_user_stats(redis_client, list(user_ids))
 
         by_spend = []
-        for idx, (user_id, score) in enumerate(spend_results, start=1):
+        for idx, (user_id, score) in enumerate(spend_results, start=offset + 1):
             user_id = user_id.decode("utf-8")
-            by_spend.append(
-                {"position": idx, "user_id": user_id, "total_spend": round(score, 2)}
-            )
+            entry = {
+                "position": idx,
+                "user_id": user_id,
+                "total_spend": round(score, 2),
+            }
+            if with_stats:
+                entry["stats"] = user_stats[user_id]
+            by_spend.append(entry)
 
         by_orders = []
-        for idx, (user_id, score) in enumerate(orders_results, start=1):
+        for idx, (user_id, score) in enumerate(orders_results, start=offset + 1):
             user_id = user_id.decode("utf-8")
-            by_orders.append(
-                {"position": idx, "user_id": user_id, "total_order_count": int(score)}
-            )
+            entry = {
+                "position": idx,
+                "user_id": user_id,
+                "total_order_count": int(score),
+            }
+            if with_stats:
+                entry["stats"] = user_stats[user_id]
+            by_orders.append(entry)
 
+        has_more = len(spend_results) == limit or len(orders_results) == limit
         return JSONResponse(
             status_code=200,
             content={
                 "total_spend_ranking": by_spend,
                 "total_order_count_ranking": by_orders,
+                "next_cursor": str(offset + limit) if has_more else None,
+            },
+        )
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+
+@api_router.post("/users/stats")
+async def get_bulk_user_stats(request: UserStatsRequest):
+    try:
+        user_ids = list(dict.fromkeys(request.user_ids))
+        user_stats = await fetch_user_stats(get_async_redis(), user_ids)
+
+        return JSONResponse(
+            status_code=200,
+            content={
+                "users": [stats for stats in user_stats.values() if stats],
+                "not_found": [
+                    user_id for user_id, stats in user_stats.items() if not stats
+                ],
             },
         )
     except Exception as e:
@@ -113,8 +575,8 @@ async def get_user_ranking(limit: int = 10):
 @api_router.get("/users/{user_id}/stats")
 async def get_user_stats(user_id: str):
     try:
-        redis_client = consumer.get_redis_client()
-        user_stats = redis_client.hgetall(f"user:{user_id}")
+        redis_client = get_async_redis()
+        user_stats = await redis_client.hgetall(f"user:{user_id}")
 
         if not user_stats:
             return JSONResponse(
@@ -122,30 +584,22 @@ async def get_user_stats(user_id: str):
                 content={"error": f"User {user_id} not found"},
             )
 
-        order_count = user_stats.get(b"order_count")
-        total_spend = user_stats.get(b"total_spend")
-        failed_order_count = user_stats.get(b"failed_order_count")
-
         return JSONResponse(
-            status_code=200,
-            content={
-                "user_id": user_id,
-                "order_count": int(order_count) if order_count else 0,
-                "total_spend": float(total_spend) if total_spend else 0.0,
-                "failed_order_count": int(failed_order_count)
-                if failed_order_count
-                else 0,
-            },
+            status_code=200, content=describe_user_stats(user_id, user_stats)
         )
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 
 @api_router.get("/stats/global")
-async def get_global_stats():
+async def get_global_stats(request: Request):
+    return await serve_cached(request, "stats:global", load_global_stats)
+
+
+async def load_global_stats():
     try:
-        redis_client = consumer.get_redis_client()
-        global_stats = redis_client.hgetall("global:stats")
+        redis_client = get_async_redis()
+        global_stats = await redis_client.hgetall("global:stats")
 
         total_orders = global_stats.get(b"total_orders")
         total_revenue = global_stats.get(b"total_revenue")
@@ -164,55 +618,274 @@ async def get_global_stats():
 
 
 @api_router.get("/stats/monthly/{month}")
-async def get_monthly_stats(month: str):
+async def get_monthly_stats(
+    request: Request,
+    month: str,
+    limit: int = Query(100, ge=1, le=MONTHLY_STATS_MAX_LIMIT),
+    offset: int = Query(0, ge=0),
+):
+    return await serve_cached(
+        request,
+        f"stats:monthly:{month}:{limit}:{offset}",
+        lambda: load_monthly_stats(month, limit, offset),
+    )
+
+
+async def load_monthly_stats(month: str, limit: int, offset: int):
     try:
-        redis_client = consumer.get_redis_client()
+        redis_client = get_async_redis()
+        monthly_key = f"monthly:{month}"
+
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.sismember("months:list", month)
+        pipe.hgetall(f"{monthly_key}:totals")
+        pipe.scard(f"{monthly_key}:users")
+        pipe.zrevrange(
+            f"{monthly_key}:ranking:total_spend",
+            offset,
+            offset + limit - 1,
+            withscores=True,
+        )
+        month_exists, totals, total_users, ranking = await pipe.execute()
 
-        if not redis_client.sismember("months:list", month):
+        if not month_exists:
             return JSONResponse(
                 status_code=404,
                 content={"error": f"No data found for month {month}"},
             )
 
-        pattern = f"monthly:{month}:user:*"
-        user_keys = redis_client.keys(pattern)
+        pipe = redis_client.pipeline(transaction=False)
+        for user_id, _ in ranking:
+            pipe.hgetall(f"{monthly_key}:user:{user_id.decode('utf-8')}")
+        user_hashes = await pipe.execute() if ranking else []
 
         user_stats = []
-        total_orders = 0
-        total_revenue = 0.0
-        total_failed_orders = 0
+        for (user_id, _), user_data in zip(ranking, user_hashes):
+            user_stats.append(
+                {
+                    "user_id": user_id.decode("utf-8"),
+                    "order_count": int(user_data.get(b"order_count", 0)),
+                    "total_spend": round(float(user_data.get(b"total_spend", 0.0)), 2),
+                    "failed_order_count": int(user_data.get(b"failed_order_count", 0)),
+                }
+            )
+
+        return JSONResponse(
+            status_code=200,
+            content={
+                "month": month,
+                "total_orders": int(totals.get(b"total_orders", 0)),
+                "total_revenue": round(float(totals.get(b"total_revenue", 0.0)), 2),
+                "failed_orders": int(totals.get(b"failed_orders", 0)),
+                "total_users": total_users,
+                "limit": limit,
+                "offset": offset,
+                "user_stats": user_stats,
+            },
+        )
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
 
-        for key in user_keys:
-            user_data = redis_client.hgetall(key)
-            user_id = key.decode("utf-8").split(":")[-1]
 
-            order_count = int(user_data.get(b"order_count", 0))
-            total_spend = float(user_data.get(b"total_spend", 0.0))
-            failed_order_count = int(user_data.get(b"failed_order_count", 0))
+@api_router.get("/stats/range")
+async def get_range_stats(
+    request: Request,
+    from_: str = Query(alias="from"),
+    to: Optional[str] = None,
+    granularity: str = "day",
+):
+    if granularity not in queryable_granularities():
+        return JSONResponse(
+            status_code=400,
+            content={
+                "error": f"Unsupported granularity: {granularity}, expected one of {', '.join(queryable_granularities())}"
+            },
+        )
+    try:
+        start = parse_timestamp(from_)
+        end = parse_timestamp(to) if to else datetime.now(timezone.utc)
+        buckets = bucket_labels(granularity, start, end)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    if not buckets:
+        return JSONResponse(
+            status_code=400,
+            content={"error": "from must not be later than to"},
+        )
 
-            total_orders += order_count
-            total_revenue += total_spend
-            total_failed_orders += failed_order_count
+    return await serve_cached(
+        request,
+        f"stats:range:{granularity}:{buckets[0]}:{buckets[-1]}",
+        lambda: load_range_stats(granularity, buckets),
+    )
 
-            user_stats.append(
+
+async def load_range_stats(granularity: str, buckets: list):
+    try:
+        redis_client = get_async_redis()
+
+        pipe = redis_client.pipeline(transaction=False)
+        for bucket in buckets:
+            pipe.hgetall(rollup_key(granularity, bucket))
+        bucket_totals = await pipe.execute()
+
+        points = []
+        for bucket, totals in zip(buckets, bucket_totals):
+            points.append(
                 {
-                    "user_id": user_id,
-                    "order_count": order_count,
-                    "total_spend": round(total_spend, 2),
-                    "failed_order_count": failed_order_count,
+                    "bucket": bucket,
+                    "total_orders": int(totals.get(b"total_orders", 0)),
+                    "total_revenue": round(float(totals.get(b"total_revenue", 0.0)), 2),
+                    "failed_orders": int(totals.get(b"failed_orders", 0)),
                 }
             )
 
-        user_stats.sort(key=lambda x: x["total_spend"], reverse=True)
+        return JSONResponse(
+            status_code=200,
+            content={
+                "granularity": granularity,
+                "from": buckets[0],
+                "to": buckets[-1],
+                "total_orders": sum(point["total_orders"] for point in points),
+                "total_revenue": round(
+                    sum(point["total_revenue"] for point in points), 2
+                ),
+                "failed_orders": sum(point["failed_orders"] for point in points),
+                "points": points,
+            },
+        )
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+
+@api_router.get("/stats/unique/{month}")
+async def get_unique_stats(request: Request, month: str):
+    return await serve_cached(
+        request, f"stats:unique:{month}", lambda: load_unique_stats(month)
+    )
+
+
+async def load_unique_stats(month: str):
+    try:
+        redis_client = get_async_redis()
+
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.pfcount(sketch_key(month, "users"))
+        pipe.pfcount(sketch_key(month, "orders"))
+        unique_users, unique_orders = await pipe.execute()
 
         return JSONResponse(
             status_code=200,
             content={
                 "month": month,
-                "total_orders": total_orders,
-                "total_revenue": round(total_revenue, 2),
-                "failed_orders": total_failed_orders,
-                "user_stats": user_stats,
+                "unique_users": unique_users,
+                "unique_orders": unique_orders,
+            },
+        )
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+
+@api_router.get("/stats/top/{month}")
+async def get_top_stats(
+    request: Request,
+    month: str,
+    dimension: str = "products",
+    k: int = Query(10, ge=1),
+):
+    if dimension not in SKETCH_DIMENSIONS:
+        return JSONResponse(
+            status_code=400,
+            content={
+                "error": f"Unsupported dimension: {dimension}, expected one of {', '.join(SKETCH_DIMENSIONS)}"
+            },
+        )
+
+    k = min(k, config.SKETCH_TOPK_CAPACITY)
+    return await serve_cached(
+        request,
+        f"stats:top:{month}:{dimension}:{k}",
+        lambda: load_top_stats(month, dimension, k),
+    )
+
+
+async def load_top_stats(month: str, dimension: str, k: int):
+    try:
+        redis_client = get_async_redis()
+
+        candidates = [
+            item.decode("utf-8")
+            for item in await redis_client.zrange(
+                sketch_key(month, f"top:{dimension}"), 0, -1
+            )
+        ]
+        # Candidates are ranked by their Count-Min estimate, read for all of
+        # them with a single HMGET.
+        cells = [cell for item in candidates for cell in cms_cells(item)]
+        counts = (
+            await redis_client.hmget(sketch_key(month, f"cms:{dimension}"), cells)
+            if cells
+            else []
+        )
+        depth = len(cells) // len(candidates) if candidates else 0
+        estimates = sorted(
+            (
+                (cms_estimate(counts[idx * depth : (idx + 1) * depth]), item)
+                for idx, item in enumerate(candidates)
+            ),
+            reverse=True,
+        )
+
+        return JSONResponse(
+            status_code=200,
+            content={
+                "month": month,
+                "dimension": dimension,
+                "k": k,
+                "top": [
+                    {"item": item, "estimated_count": estimate}
+                    for estimate, item in estimates[:k]
+                ],
+            },
+        )
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+
+@api_router.get("/stats/quantiles/{month}")
+async def get_quantile_stats(
+    request: Request,
+    month: str,
+    q: list[float] = Query([0.5, 0.9, 0.95, 0.99]),
+):
+    if any(not 0 <= quantile <= 1 for quantile in q):
+        return JSONResponse(
+            status_code=400,
+            content={"error": "Quantiles must be between 0 and 1"},
+        )
+
+    return await serve_cached(
+        request,
+        f"stats:quantiles:{month}:{','.join(map(str, q))}",
+        lambda: load_quantile_stats(month, q),
+    )
+
+
+async def load_quantile_stats(month: str, quantiles: list):
+    try:
+        redis_client = get_async_redis()
+        bucket_counts = await redis_client.hgetall(sketch_key(month, "order_value"))
+        estimates = estimate_quantiles(bucket_counts, quantiles)
+
+        return JSONResponse(
+            status_code=200,
+            content={
+                "month": month,
+                "order_count": sum(int(count) for count in bucket_counts.values()),
+                "relative_accuracy": config.SKETCH_QUANTILE_ACCURACY,
+                "quantiles": {
+                    str(quantile): estimate for quantile, estimate in estimates.items()
+                },
             },
         )
     except Exception as e:
@@ -0,0 +1,118 @@
+import gzip
+import os
+import threading
+import time
+import zlib
+from pathlib import Path
+
+from config import config
+from logger import write_log
+from schema import encode_archived_orders
+
+ARCHIVE_SUFFIX = ".ndjson.gz"
+ARCHIVE_COMPRESS_LEVEL = 6
+ARCHIVE_READ_BLOCK_SIZE = 1024 * 1024
+# zlib window bits that read a gzip header and trailer.
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+class OrderArchive:
+    # Appends committed orders to gzip-compressed NDJSON segments under
+    # ARCHIVE_DIR. Every process writes its own segment, so consumer workers
+    # never share a file or a lock, and a segment is closed for a new one
+    # once it reaches ARCHIVE_SEGMENT_MAX_BYTES. Each append is a complete
+    # gzip member: a crash can only cut the member being written, never
+    # corrupt the ones before it.
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.reset()
+
+    def reset(self):
+        self.lock = threading.Lock()
+        self.path = None
+        self.size = 0
+        self.pid = None
+
+    def open_segment(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.pid = os.getpid()
+        self.path = self.directory / (
+            f"orders-{time.time_ns() // 1_000_000}-{self.pid}{ARCHIVE_SUFFIX}"
+        )
+        self.size = 0
+
+    def append(self, orders: list):
+        if not orders:
+            return
+        data = gzip.compress(
+            encode_archived_orders(orders), compresslevel=ARCHIVE_COMPRESS_LEVEL
+        )
+        with self.lock:
+            if (
+                self.pid != os.getpid()
+                or self.size >= config.ARCHIVE_SEGMENT_MAX_BYTES
+            ):
+                self.open_segment()
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, data)
+            finally:
+                os.close(fd)
+            self.size += len(data)
+
+    def archive_committed(self, orders: list):
+        # Archiving happens after the commit, so a failure here never fails
+        # the batch; the orders are counted, only a later rebuild misses them.
+        try:
+            self.append(orders)
+        except OSError as e:
+            write_log(f"[ARCHIVE ERROR] Failed to archive orders: {e}", level="ERROR")
+
+
+def list_segments():
+    # (path, size) of every segment, oldest first. Sizes are taken once, so a
+    # replay reads exactly what was archived when it started.
+    directory = Path(config.ARCHIVE_DIR)
+    if not directory.is_dir():
+        return []
+    segments = []
+    for path in sorted(directory.glob(f"*{ARCHIVE_SUFFIX}")):
+        try:
+            segments.append((path, path.stat().st_size))
+        except FileNotFoundError:
+            continue
+    return segments
+
+
+def read_segment(path: Path, size: int):
+    # Streams the first `size` bytes of a segment block by block and yields
+    # (compressed bytes read, complete lines) pairs. Members are decompressed
+    # one after another; a member that is still being written only yields
+    # its complete lines.
+    decompressor = zlib.decompressobj(GZIP_WBITS)
+    remainder = b""
+    with open(path, "rb") as f:
+        while size > 0:
+            block = f.read(min(ARCHIVE_READ_BLOCK_SIZE, size))
+            if not block:
+                break
+            size -= len(block)
+
+            parts = [remainder]
+            data = block
+            while data:
+                parts.append(decompressor.decompress(data))
+                if not decompressor.eof:
+                    break
+                data = decompressor.unused_data
+                decompressor = zlib.decompressobj(GZIP_WBITS)
+
+            lines = b"".join(parts).split(b"\n")
+            remainder = lines.pop()
+            yield len(block), lines
+
+
+order_archive = OrderArchive(Path(config.ARCHIVE_DIR))
+# A forked process starts its own segment instead of appending to its
+# parent's.
+os.register_at_fork(after_in_child=order_archive.reset)
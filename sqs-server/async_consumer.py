@@ -0,0 +1,345 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from aggregation import AggregationBuffer
+from config import config
+from consumer import ORDER_COMMITTED, ORDER_FAILED, AckBatcher, Consumer
+from dedup import dedup_window
+from logger import write_log
+from metrics import (
+    ACK_STAGE,
+    COMMIT_STAGE,
+    PARSE_STAGE,
+    REDIS_PIPELINE_SECONDS,
+    REDIS_WATCH_RETRIES,
+    record_receive,
+)
+from polling import AdaptivePoller
+from redis import WatchError
+from redis.asyncio import Redis as AsyncRedis
+from redis_pool import create_async_pool
+from sqs_client import get_sqs_client
+from visibility import VisibilityHeartbeat
+
+
+class AsyncConsumer(Consumer):
+    # Keeps up to CONSUMER_ASYNC_RECEIVERS long polls in flight, as many as the
+    # adaptive poller asks for, and hands received batches to
+    # CONSUMER_ASYNC_CONCURRENCY workers through a bounded queue, so receivers
+    # stop polling while the workers are saturated. boto3 calls run on a
+    # dedicated thread pool, Redis writes use redis.asyncio.
+    def __init__(self):
+        super().__init__()
+        self.executor = None
+        self.batches = None
+        self.stop_event = None
+        self.stats = None
+        self.aggregation_flusher = None
+        self.receivers_changed = None
+        self.acks_queued = None
+
+    def get_sqs_client(self):
+        self.sqs = get_sqs_client(self.executor_size())
+        return self.sqs
+
+    def get_redis_client(self):
+        self.redis_client = AsyncRedis(connection_pool=create_async_pool())
+        return self.redis_client
+
+    def executor_size(self):
+        return config.CONSUMER_ASYNC_RECEIVERS + config.CONSUMER_ASYNC_CONCURRENCY
+
+    async def run_sqs(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+
+    async def handle_redis_db_insertion(self, orders: list):
+        orders = self.with_digests(orders)
+        digests = [digest for _, _, digest in orders if digest is not None]
+
+        for _ in range(config.DEDUP_MAX_RETRIES + 1):
+            try:
+                async with self.redis_client.pipeline(transaction=True) as pipe:
+                    seen = set()
+                    if digests:
+                        keys = dedup_window.keys(digests)
+                        await pipe.watch(*keys)
+                        seen = dedup_window.collect_seen(
+                            await pipe.mget(keys), digests
+                        )
+                        pipe.multi()
+
+                    statuses, committed_digests = self.queue_merged_updates(
+                        pipe, orders, seen
+                    )
+                    if committed_digests:
+                        dedup_window.queue_mark(pipe, committed_digests)
+                    if ORDER_COMMITTED in statuses:
+                        await pipe.execute()
+                    return statuses
+
+            except WatchError:
+                REDIS_WATCH_RETRIES.inc()
+                continue
+            except Exception as e:
+                write_log(f"[REDIS ERROR] Failed to update Redis DB: {e}", level="ERROR")
+                return [ORDER_FAILED] * len(orders)
+
+        write_log(
+            "[REDIS ERROR] Dedup keys kept changing during commit, will retry batch",
+            level="ERROR",
+        )
+        return [ORDER_FAILED] * len(orders)
+
+    async def flush_acks(self):
+        entries = self.acks.take()
+        if entries:
+            await self.run_sqs(self.acks.delete_entries, entries)
+
+    async def add_acks(self, acks: list):
+        # Same SQS_ACK_FLUSH_POLICY as the sync loop, with the deletes run on
+        # the thread pool; batches queue into one shared AckBatcher.
+        for message, label in acks:
+            self.acks.queue(message, label)
+        if self.acks.pending:
+            self.acks_queued.set()
+        if self.acks.policy == "threshold" and self.acks.is_due():
+            await self.flush_acks()
+
+    async def end_of_batch(self):
+        if self.acks.flush_after_batch():
+            await self.flush_acks()
+
+    async def release_batch(self, token, messages: list = None):
+        # Waits for an extension already being sent off the event loop.
+        extension = self.heartbeat.detach(token, messages)
+        if extension:
+            await self.run_sqs(extension.wait)
+
+    async def commit_orders(self, pending: list, tokens: list):
+        acks = []
+        retries = []
+        try:
+            if pending:
+                orders = [
+                    (order_data, is_failed, self.dedup_id(message, order_data))
+                    for message, order_data, is_failed in pending
+                ]
+                with REDIS_PIPELINE_SECONDS.time():
+                    statuses = await self.handle_redis_db_insertion(orders)
+                self.archive_orders(pending, statuses)
+                acks, retries = self.collect_acks(pending, statuses)
+        finally:
+            for token in tokens:
+                await self.release_batch(token)
+
+        if retries:
+            await self.run_sqs(self.retry_later, retries)
+        await self.add_acks(acks)
+
+    async def flush_aggregation(self):
+        pending, tokens = self.aggregation.take()
+        if pending or tokens:
+            await self.commit_orders(pending, tokens)
+
+    async def handle_message(self, messages: list):
+        token = self.heartbeat.track(messages)
+        try:
+            with PARSE_STAGE.time():
+                pending, acks = self.parse_messages(messages)
+        except Exception:
+            await self.release_batch(token)
+            raise
+
+        if acks:
+            # Undecodable messages are acked now; stop extending them.
+            await self.release_batch(token, [message for message, _ in acks])
+        await self.add_acks(acks)
+
+        with COMMIT_STAGE.time():
+            if self.aggregation:
+                self.aggregation.add(pending, token)
+                if self.aggregation.is_due():
+                    await self.flush_aggregation()
+            else:
+                await self.commit_orders(pending, [token])
+        with ACK_STAGE.time():
+            await self.end_of_batch()
+
+    async def aggregation_loop(self):
+        while True:
+            await asyncio.sleep(self.aggregation.time_until_due())
+            if self.aggregation.is_due():
+                try:
+                    await self.flush_aggregation()
+                    await self.end_of_batch()
+                except Exception as e:
+                    write_log(
+                        f"[ERROR] Error flushing aggregation buffer: {e}", level="ERROR"
+                    )
+
+    async def ack_loop(self):
+        # Flushes acks whose SQS_ACK_FLUSH_INTERVAL_MS passed without another
+        # batch ending.
+        while True:
+            await self.acks_queued.wait()
+            due = self.acks.time_until_due()
+            if due is None:
+                self.acks_queued.clear()
+                continue
+            await asyncio.sleep(due)
+            if self.acks.is_due():
+                try:
+                    await self.flush_acks()
+                except Exception as e:
+                    write_log(f"[ERROR] Error flushing acks: {e}", level="ERROR")
+
+    async def adjust_receivers(self):
+        if self.poller.adjust_receivers(
+            config.CONSUMER_ASYNC_CONCURRENCY, self.batches.full()
+        ):
+            async with self.receivers_changed:
+                self.receivers_changed.notify_all()
+
+    async def wait_for_receiver_slot(self, index: int):
+        async with self.receivers_changed:
+            await self.receivers_changed.wait_for(
+                lambda: index < self.poller.receivers or self.stop_event.is_set()
+            )
+
+    async def queue_depth_loop(self):
+        # Receives only show how full batches are; the queue depth tells a
+        # backlog from a steady trickle.
+        while True:
+            await asyncio.sleep(config.SQS_QUEUE_DEPTH_INTERVAL_SECONDS)
+            try:
+                response = await self.run_sqs(
+                    self.sqs.get_queue_attributes,
+                    QueueUrl=self.queue_url,
+                    AttributeNames=["ApproximateNumberOfMessages"],
+                )
+                self.poller.record_depth(
+                    int(response["Attributes"]["ApproximateNumberOfMessages"])
+                )
+                await self.adjust_receivers()
+            except Exception as e:
+                write_log(f"[ERROR] Failed to read queue depth: {e}", level="WARNING")
+
+    async def receive_loop(self, index: int):
+        while not self.stop_event.is_set():
+            if index >= self.poller.receivers:
+                await self.wait_for_receiver_slot(index)
+                continue
+            try:
+                request = self.receive_request()
+                started = time.perf_counter()
+                response = await self.run_sqs(self.sqs.receive_message, **request)
+                elapsed = time.perf_counter() - started
+                messages = response.get("Messages", [])
+                record_receive(elapsed, messages, request["MaxNumberOfMessages"])
+                self.poller.record_receive(elapsed, len(messages))
+                await self.adjust_receivers()
+                if self.stats:
+                    self.stats.beat()
+                if messages:
+                    await self.batches.put(messages)
+                elif not self.poller.wait_time:
+                    await asyncio.sleep(config.SQS_MESSAGE_PROCESSING_DELAY)
+
+            except Exception as e:
+                write_log(f"[ERROR] Error receiving messages: {e}", level="ERROR")
+                await asyncio.sleep(config.SQS_MESSAGE_PROCESSING_DELAY)
+
+    async def process_loop(self):
+        while True:
+            messages = await self.batches.get()
+            try:
+                started = time.perf_counter()
+                await self.handle_message(messages)
+                self.poller.record_processing(time.perf_counter() - started)
+                if self.stats:
+                    self.stats.record(len(messages))
+            except Exception as e:
+                write_log(f"[ERROR] Error processing batch: {e}", level="ERROR")
+            finally:
+                self.batches.task_done()
+
+    async def watch_stop_event(self, stop_event):
+        while not stop_event.is_set():
+            await asyncio.sleep(0.5)
+        self.stop_event.set()
+        async with self.receivers_changed:
+            self.receivers_changed.notify_all()
+
+    async def run(self, stop_event=None, stats=None):
+        self.stats = stats
+        self.executor = ThreadPoolExecutor(max_workers=self.executor_size())
+        self.batches = asyncio.Queue(maxsize=config.CONSUMER_ASYNC_QUEUE_SIZE)
+        self.stop_event = asyncio.Event()
+
+        if not self.sqs:
+            self.sqs = self.get_sqs_client()
+        if not self.queue_url:
+            self.queue_url = await self.run_sqs(self.get_queue_url)
+        if not self.redis_client:
+            self.redis_client = self.get_redis_client()
+        if not self.acks:
+            self.acks = AckBatcher(self.sqs, self.queue_url)
+        if not self.heartbeat:
+            self.heartbeat = VisibilityHeartbeat(self.sqs, self.queue_url)
+        self.heartbeat.start()
+        if config.AGGREGATION_ENABLED and not self.aggregation:
+            self.aggregation = AggregationBuffer()
+        self.poller = AdaptivePoller(config.CONSUMER_ASYNC_RECEIVERS)
+        self.receivers_changed = asyncio.Condition()
+        self.acks_queued = asyncio.Event()
+
+        receivers = [
+            asyncio.create_task(self.receive_loop(index))
+            for index in range(config.CONSUMER_ASYNC_RECEIVERS)
+        ]
+        workers = [
+            asyncio.create_task(self.process_loop())
+            for _ in range(config.CONSUMER_ASYNC_CONCURRENCY)
+        ]
+
+        ack_flusher = asyncio.create_task(self.ack_loop())
+        if self.aggregation:
+            self.aggregation_flusher = asyncio.create_task(self.aggregation_loop())
+        depth_sampler = None
+        if self.poller.adaptive and self.poller.max_receivers > 1:
+            depth_sampler = asyncio.create_task(self.queue_depth_loop())
+
+        watcher = None
+        if stop_event:
+            watcher = asyncio.create_task(self.watch_stop_event(stop_event))
+
+        try:
+            await asyncio.gather(*receivers)
+        finally:
+            # Receivers have stopped polling; let the workers drain every
+            # batch already received before shutting down.
+            await self.batches.join()
+            for worker in workers:
+                worker.cancel()
+            if self.aggregation:
+                self.aggregation_flusher.cancel()
+                await self.flush_aggregation()
+            ack_flusher.cancel()
+            await self.flush_acks()
+            if watcher:
+                watcher.cancel()
+            if depth_sampler:
+                depth_sampler.cancel()
+            self.heartbeat.stop()
+            await self.redis_client.aclose()
+            await self.redis_client.connection_pool.disconnect()
+            self.executor.shutdown(wait=False)
+
+    def start(self, stop_event=None, stats=None):
+        asyncio.run(self.run(stop_event, stats))
+
+
+async_consumer = AsyncConsumer()
@@ -0,0 +1,74 @@
+from logger import write_log
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def months_without_index(redis_client):
+    # Months written before the per-month index existed have user hashes but
+    # no totals hash; every month written since has one.
+    months = sorted(
+        month.decode("utf-8") for month in redis_client.smembers("months:list")
+    )
+    with redis_client.pipeline(transaction=False) as pipe:
+        for month in months:
+            pipe.exists(f"monthly:{month}:totals")
+        indexed = pipe.execute() if months else []
+    return [month for month, exists in zip(months, indexed) if not exists]
+
+
+def backfill_month(redis_client, month: str):
+    # Rebuilds a month's totals, user index and rankings from its per-user
+    # hashes, the way the old monthly endpoint summed them on every request.
+    monthly_key = f"monthly:{month}"
+    prefix = f"{monthly_key}:user:"
+    keys = list(redis_client.scan_iter(match=f"{prefix}*", count=BACKFILL_BATCH_SIZE))
+
+    order_count = 0
+    total_spend = 0.0
+    failed_order_count = 0
+    spend_ranking = {}
+    count_ranking = {}
+    for offset in range(0, len(keys), BACKFILL_BATCH_SIZE):
+        chunk = keys[offset : offset + BACKFILL_BATCH_SIZE]
+        with redis_client.pipeline(transaction=False) as pipe:
+            for key in chunk:
+                pipe.hgetall(key)
+            user_hashes = pipe.execute()
+        for key, user_data in zip(chunk, user_hashes):
+            user_id = key.decode("utf-8")[len(prefix) :]
+            user_orders = int(user_data.get(b"order_count", 0))
+            user_spend = float(user_data.get(b"total_spend", 0.0))
+            order_count += user_orders
+            total_spend += user_spend
+            failed_order_count += int(user_data.get(b"failed_order_count", 0))
+            spend_ranking[user_id] = user_spend
+            count_ranking[user_id] = user_orders
+
+    with redis_client.pipeline(transaction=True) as pipe:
+        pipe.delete(
+            f"{monthly_key}:users",
+            f"{monthly_key}:ranking:total_spend",
+            f"{monthly_key}:ranking:total_order_count",
+        )
+        pipe.hset(
+            f"{monthly_key}:totals",
+            mapping={
+                "total_orders": order_count,
+                "total_revenue": total_spend,
+                "failed_orders": failed_order_count,
+            },
+        )
+        if spend_ranking:
+            pipe.sadd(f"{monthly_key}:users", *spend_ranking)
+            pipe.zadd(f"{monthly_key}:ranking:total_spend", spend_ranking)
+            pipe.zadd(f"{monthly_key}:ranking:total_order_count", count_ranking)
+        pipe.execute()
+    return len(spend_ranking)
+
+
+def backfill_monthly_indexes(redis_client):
+    # One-off: runs on startup before any consumer can write to a month, and
+    # finds nothing to do once every month has been indexed.
+    for month in months_without_index(redis_client):
+        users = backfill_month(redis_client, month)
+        write_log(f"[BACKFILL] Indexed month {month} ({users} users)")
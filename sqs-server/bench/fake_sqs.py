@@ -0,0 +1,198 @@
+import itertools
+import threading
+import time
+import uuid
+from collections import deque
+from types import SimpleNamespace
+
+from botocore.hooks import HierarchicalEmitter
+
+
+class FakeMessage:
+    __slots__ = (
+        "message_id",
+        "body",
+        "message_attributes",
+        "sent_at",
+        "sent_timestamp",
+        "receive_count",
+        "visible_at",
+    )
+
+    def __init__(self, body: str, message_attributes: dict):
+        self.message_id = str(uuid.uuid4())
+        self.body = body
+        self.message_attributes = message_attributes
+        self.sent_at = time.perf_counter()
+        self.sent_timestamp = str(int(time.time() * 1000))
+        self.receive_count = 0
+        self.visible_at = 0.0
+
+
+class FakeQueue:
+    def __init__(self, name: str):
+        self.name = name
+        self.attributes = {"QueueArn": f"arn:aws:sqs:local:000000000000:{name}"}
+        self.visible = deque()
+        self.in_flight = {}
+
+
+class FakeSQS:
+    # In-process stand-in for the part of the SQS API the producer, consumers
+    # and DLQ helpers use, with long polling, visibility timeouts and receive
+    # counts. It records send-to-delete latency for every deleted message.
+    # Redrive policies are stored but not enforced. Client event handlers
+    # can be registered but are never fired.
+    def __init__(self):
+        self.meta = SimpleNamespace(events=HierarchicalEmitter())
+        self.queues = {}
+        self.condition = threading.Condition()
+        self.receipts = itertools.count()
+        self.sent = 0
+        self.deleted = 0
+        self.latencies = []
+        self.first_receive_at = None
+        self.last_delete_at = None
+
+    def queue(self, queue_url: str):
+        return self.queues[queue_url.rsplit("/", 1)[-1]]
+
+    def create_queue(self, QueueName: str, **kwargs):
+        with self.condition:
+            self.queues.setdefault(QueueName, FakeQueue(QueueName))
+        return {"QueueUrl": f"http://fake-sqs/000000000000/{QueueName}"}
+
+    def get_queue_attributes(self, QueueUrl: str, AttributeNames: list):
+        with self.condition:
+            queue = self.queue(QueueUrl)
+            attributes = dict(
+                queue.attributes,
+                ApproximateNumberOfMessages=str(len(queue.visible)),
+                ApproximateNumberOfMessagesNotVisible=str(len(queue.in_flight)),
+            )
+        if "All" in AttributeNames:
+            return {"Attributes": attributes}
+        return {
+            "Attributes": {
+                name: attributes[name] for name in AttributeNames if name in attributes
+            }
+        }
+
+    def set_queue_attributes(self, QueueUrl: str, Attributes: dict):
+        with self.condition:
+            self.queue(QueueUrl).attributes.update(Attributes)
+        return {}
+
+    def send_message_batch(self, QueueUrl: str, Entries: list):
+        successful = []
+        with self.condition:
+            queue = self.queue(QueueUrl)
+            for entry in Entries:
+                message = FakeMessage(
+                    entry["MessageBody"], entry.get("MessageAttributes", {})
+                )
+                queue.visible.append(message)
+                successful.append({"Id": entry["Id"], "MessageId": message.message_id})
+            self.sent += len(Entries)
+            self.condition.notify_all()
+        return {"Successful": successful, "Failed": []}
+
+    def requeue_expired(self, queue: FakeQueue, now: float):
+        expired = [
+            receipt_handle
+            for receipt_handle, message in queue.in_flight.items()
+            if message.visible_at <= now
+        ]
+        for receipt_handle in expired:
+            queue.visible.append(queue.in_flight.pop(receipt_handle))
+
+    def receive_message(
+        self,
+        QueueUrl: str,
+        MaxNumberOfMessages: int = 1,
+        WaitTimeSeconds: int = 0,
+        VisibilityTimeout: int = 30,
+        **kwargs,
+    ):
+        deadline = time.monotonic() + WaitTimeSeconds
+        with self.condition:
+            queue = self.queue(QueueUrl)
+            while True:
+                now = time.monotonic()
+                self.requeue_expired(queue, now)
+                if queue.visible or now >= deadline:
+                    break
+                # Wake up periodically so expired in-flight messages return.
+                self.condition.wait(min(deadline - now, 0.1))
+
+            messages = []
+            while queue.visible and len(messages) < MaxNumberOfMessages:
+                message = queue.visible.popleft()
+                message.receive_count += 1
+                message.visible_at = now + VisibilityTimeout
+                receipt_handle = f"{message.message_id}:{next(self.receipts)}"
+                queue.in_flight[receipt_handle] = message
+                messages.append(
+                    {
+                        "MessageId": message.message_id,
+                        "ReceiptHandle": receipt_handle,
+                        "Body": message.body,
+                        "Attributes": {
+                            "ApproximateReceiveCount": str(message.receive_count),
+                            "SentTimestamp": message.sent_timestamp,
+                        },
+                        "MessageAttributes": message.message_attributes,
+                    }
+                )
+            if messages and self.first_receive_at is None:
+                self.first_receive_at = time.perf_counter()
+
+        return {"Messages": messages} if messages else {}
+
+    def delete_message_batch(self, QueueUrl: str, Entries: list):
+        successful = []
+        failed = []
+        with self.condition:
+            queue = self.queue(QueueUrl)
+            now = time.perf_counter()
+            for entry in Entries:
+                message = queue.in_flight.pop(entry["ReceiptHandle"], None)
+                if message is None:
+                    failed.append(
+                        {
+                            "Id": entry["Id"],
+                            "SenderFault": True,
+                            "Code": "ReceiptHandleIsInvalid",
+                            "Message": "The receipt handle has expired",
+                        }
+                    )
+                    continue
+                successful.append({"Id": entry["Id"]})
+                self.latencies.append(now - message.sent_at)
+            self.deleted += len(successful)
+            self.last_delete_at = now
+        return {"Successful": successful, "Failed": failed}
+
+    def change_message_visibility_batch(self, QueueUrl: str, Entries: list):
+        successful = []
+        failed = []
+        with self.condition:
+            queue = self.queue(QueueUrl)
+            now = time.monotonic()
+            for entry in Entries:
+                message = queue.in_flight.get(entry["ReceiptHandle"])
+                if message is None:
+                    failed.append(
+                        {
+                            "Id": entry["Id"],
+                            "SenderFault": True,
+                            "Code": "ReceiptHandleIsInvalid",
+                            "Message": "The receipt handle has expired",
+                        }
+                    )
+                    continue
+                message.visible_at = now + entry["VisibilityTimeout"]
+                successful.append({"Id": entry["Id"]})
+            self.requeue_expired(queue, now)
+            self.condition.notify_all()
+        return {"Successful": successful, "Failed": failed}
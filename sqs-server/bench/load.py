@@ -0,0 +1,364 @@
+# Offline load test for the producer and the consumer engines. SQS is
+# replaced by the in-process FakeSQS and Redis by fakeredis (or a real Redis
+# given with --redis-url), so it runs without LocalStack. Prints a summary
+# table to stderr and the results as JSON to stdout (or --output).
+#
+#   cd sqs-server && python -m bench.load --messages 20000 --workers 2
+#
+# Stage times are exclusive (a log write inside validation counts as log).
+# With --consumer async the redis stage is the wall time spent awaiting the
+# commit and overlaps with other batches.
+
+import argparse
+import json
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+from functools import wraps
+from itertools import cycle, islice
+
+import boto3
+import redis
+import redis.asyncio
+import redis.connection
+from bench.fake_sqs import FakeSQS
+from config import config
+
+STAGES = ("decode", "validate", "redis", "ack", "log")
+
+
+class StageTimer:
+    # Thread-local stack of running stages, so nested stages are only counted
+    # once, under the innermost stage.
+    def __init__(self):
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.totals = dict.fromkeys(STAGES, 0.0)
+
+    def add(self, stage: str, seconds: float):
+        with self.lock:
+            self.totals[stage] += seconds
+
+    def wrap(self, stage: str, func):
+        @wraps(func)
+        def timed(*args, **kwargs):
+            stack = self.local.__dict__.setdefault("stack", [])
+            frame = [0.0]
+            stack.append(frame)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                stack.pop()
+                if stack:
+                    stack[-1][0] += elapsed
+                self.add(stage, elapsed - frame[0])
+
+        return timed
+
+    def wrap_async(self, stage: str, func):
+        @wraps(func)
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - started)
+
+        return timed
+
+
+class CommandCounter:
+    # Counts every command redis-py serialises, including WATCH/MULTI/EXEC
+    # and connection handshakes.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def wrap(self, func):
+        @wraps(func)
+        def counted(*args, **kwargs):
+            with self.lock:
+                self.count += 1
+            return func(*args, **kwargs)
+
+        return counted
+
+    def install(self):
+        for serializer in (
+            redis.connection.PythonRespSerializer,
+            redis.connection.HiredisRespSerializer,
+        ):
+            serializer.pack = self.wrap(serializer.pack)
+        connection = redis.asyncio.connection.Connection
+        connection.pack_command = self.wrap(connection.pack_command)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--consumer", choices=("sync", "async"), default="sync")
+    parser.add_argument(
+        "--workers", type=int, default=1, help="consumer instances, one thread each"
+    )
+    parser.add_argument("--receive-batch", type=int, default=10)
+    parser.add_argument("--produce-batch", type=int, default=10)
+    parser.add_argument("--producer-workers", type=int, default=8)
+    parser.add_argument(
+        "--produce-chunk", type=int, default=1000, help="orders per producer call"
+    )
+    parser.add_argument(
+        "--rate", type=float, default=0, help="target produce rate, 0 for unpaced"
+    )
+    parser.add_argument(
+        "--items", type=int, default=0, help="items per order, 0 keeps 1-100"
+    )
+    parser.add_argument("--aggregation", action="store_true")
+    parser.add_argument("--redis-url", help="use this Redis (it is flushed)")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--output", help="write the JSON results here")
+    return parser.parse_args()
+
+
+def configure(args):
+    config.SQS_MAX_NUMBER_OF_MESSAGES = args.receive_batch
+    config.SQS_WAIT_TIME_SECONDS = 1
+    config.PRODUCER_BATCH_SIZE = args.produce_batch
+    config.PRODUCER_MAX_WORKERS = args.producer_workers
+    config.AGGREGATION_ENABLED = args.aggregation
+    config.CONSUMER_MODE = args.consumer
+    # Keep metric samples away from a server running on the same machine.
+    config.PROMETHEUS_MULTIPROC_DIR = os.path.join(os.getcwd(), "metrics")
+
+
+def install_redis(args):
+    import redis_pool
+
+    if args.redis_url:
+        redis.Redis.from_url(args.redis_url).flushdb()
+        sync_pool = redis.ConnectionPool.from_url(args.redis_url)
+
+        def async_pool():
+            return redis.asyncio.ConnectionPool.from_url(args.redis_url)
+
+    else:
+        import fakeredis
+
+        server = fakeredis.FakeServer()
+        sync_pool = redis.ConnectionPool(
+            connection_class=fakeredis.FakeRedisConnection, server=server
+        )
+
+        def async_pool():
+            return redis.asyncio.ConnectionPool(
+                connection_class=fakeredis.FakeAsyncRedisConnection, server=server
+            )
+
+    redis_pool.sync_pool = sync_pool
+    redis_pool.create_async_pool = async_pool
+    return redis.Redis(connection_pool=sync_pool)
+
+
+def install_stage_timers(timer: StageTimer):
+    import async_consumer
+    import consumer
+    from logger import log_writer
+
+    consumer.decode_order = timer.wrap("decode", consumer.decode_order)
+    consumer.Consumer.validate_order_data = timer.wrap(
+        "validate", consumer.Consumer.validate_order_data
+    )
+    consumer.Consumer.handle_redis_db_insertion = timer.wrap(
+        "redis", consumer.Consumer.handle_redis_db_insertion
+    )
+    async_consumer.AsyncConsumer.handle_redis_db_insertion = timer.wrap_async(
+        "redis", async_consumer.AsyncConsumer.handle_redis_db_insertion
+    )
+    consumer.AckBatcher.delete_entries = timer.wrap(
+        "ack", consumer.AckBatcher.delete_entries
+    )
+    log_writer.write = timer.wrap("log", log_writer.write)
+    log_writer.flush = timer.wrap("log", log_writer.flush)
+
+
+def resize_items(generate, items: int):
+    @wraps(generate)
+    def generate_with_items():
+        order = generate()
+        calculated = sum(item.quantity * item.price_per_unit for item in order.items)
+        consistent = round(calculated, 2) == round(order.order_value, 2)
+        order.items = list(islice(cycle(order.items), items))
+        if consistent:
+            order.order_value = round(
+                sum(item.quantity * item.price_per_unit for item in order.items), 2
+            )
+        return order
+
+    return generate_with_items
+
+
+def percentile(values: list, pct: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def produce(producer, args):
+    sent = 0
+    failed = 0
+    busy = 0.0
+    started = time.perf_counter()
+    while sent + failed < args.messages:
+        count = min(args.produce_chunk, args.messages - sent - failed)
+        call_started = time.perf_counter()
+        results = producer.send_orders_to_queue(count)
+        busy += time.perf_counter() - call_started
+        failed += sum(1 for order in results if order["status"] == "failed")
+        sent += sum(1 for order in results if order["status"] == "sent")
+
+        if args.rate:
+            ahead = (sent + failed) / args.rate - (time.perf_counter() - started)
+            if ahead > 0:
+                time.sleep(ahead)
+    return sent, failed, busy
+
+
+def run(args):
+    configure(args)
+    fake_sqs = FakeSQS()
+    boto3.client = lambda *_, **__: fake_sqs
+    redis_client = install_redis(args)
+    commands = CommandCounter()
+    commands.install()
+    timer = StageTimer()
+    install_stage_timers(timer)
+
+    from async_consumer import AsyncConsumer
+    from consumer import Consumer
+    from logger import flush_logs
+    from producer import Producer
+    from supervisor import WorkerStats
+
+    producer = Producer()
+    if args.items:
+        producer.generate_random_order = resize_items(
+            producer.generate_random_order, args.items
+        )
+
+    stop_event = threading.Event()
+    workers = []
+    for index in range(args.workers):
+        engine = AsyncConsumer() if args.consumer == "async" else Consumer()
+        stats = WorkerStats()
+        thread = threading.Thread(
+            target=engine.start, args=(stop_event, stats), name=f"bench-consumer-{index}"
+        )
+        thread.start()
+        workers.append((thread, stats))
+
+    commands_before = commands.count
+    sent, produce_failed, produce_seconds = produce(producer, args)
+
+    deadline = time.monotonic() + args.timeout
+    while fake_sqs.deleted < sent and time.monotonic() < deadline:
+        time.sleep(0.05)
+    stop_event.set()
+    for thread, _ in workers:
+        thread.join()
+    flush_logs()
+
+    consumed = fake_sqs.deleted
+    consume_seconds = (
+        fake_sqs.last_delete_at - fake_sqs.first_receive_at if consumed else 0.0
+    )
+    global_stats = redis_client.hgetall("global:stats")
+    orders = sum(
+        int(global_stats.get(field, 0)) for field in (b"total_orders", b"failed_orders")
+    )
+
+    return {
+        "config": vars(args),
+        "produce": {
+            "messages": sent,
+            "failed": produce_failed,
+            "seconds": round(produce_seconds, 4),
+            "messages_per_second": round(sent / produce_seconds, 1)
+            if produce_seconds
+            else None,
+        },
+        "consume": {
+            "messages": consumed,
+            "orders_committed": orders,
+            "complete": consumed >= sent,
+            "seconds": round(consume_seconds, 4),
+            "messages_per_second": round(consumed / consume_seconds, 1)
+            if consume_seconds
+            else None,
+            "worker_processed": [
+                stats.processed_messages.value for _, stats in workers
+            ],
+        },
+        "latency_ms": {
+            name: round(percentile(fake_sqs.latencies, pct) * 1000, 2)
+            if fake_sqs.latencies
+            else None
+            for name, pct in (("p50", 50), ("p90", 90), ("p99", 99), ("max", 100))
+        },
+        "redis": {
+            "commands": commands.count - commands_before,
+            "commands_per_order": round(
+                (commands.count - commands_before) / orders, 3
+            )
+            if orders
+            else None,
+        },
+        "stages_us_per_message": {
+            stage: round(seconds / consumed * 1e6, 2) if consumed else None
+            for stage, seconds in timer.totals.items()
+        },
+    }
+
+
+def print_summary(results: dict):
+    produce = results["produce"]
+    consume = results["consume"]
+    latency = results["latency_ms"]
+    lines = [
+        f"produce   {produce['messages']} msgs in {produce['seconds']}s, {produce['messages_per_second']} msgs/s",
+        f"consume   {consume['messages']} msgs in {consume['seconds']}s, {consume['messages_per_second']} msgs/s"
+        + ("" if consume["complete"] else "  (INCOMPLETE, timed out)"),
+        f"latency   p50 {latency['p50']} ms, p90 {latency['p90']} ms, p99 {latency['p99']} ms, max {latency['max']} ms",
+        f"redis     {results['redis']['commands_per_order']} commands/order",
+        "stages    "
+        + ", ".join(
+            f"{stage} {us} us"
+            for stage, us in results["stages_us_per_message"].items()
+        ),
+    ]
+    print("\n".join(lines), file=sys.stderr)
+
+
+def main():
+    args = parse_args()
+    if args.output:
+        args.output = os.path.abspath(args.output)
+    # Consumer logs go to the working directory; keep them out of the tree.
+    os.chdir(tempfile.mkdtemp(prefix="sqs-bench-"))
+    results = run(args)
+    print_summary(results)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
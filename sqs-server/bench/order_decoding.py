@@ -0,0 +1,119 @@
+# Compares the per-message decode + validate cost of the typed msgspec order
+# model against the previous json.loads + dict lookups path, and the encode
+# cost of both on the producer side.
+#
+#   cd sqs-server && python -m bench.order_decoding --messages 5000
+
+import argparse
+import json
+import random
+import timeit
+from datetime import datetime
+
+from schema import decode_order, encode_order, order_decoder
+
+
+def sample_order(rng: random.Random):
+    items = [
+        {
+            "product_id": f"P00{rng.randint(1, 6)}",
+            "quantity": rng.randint(1, 100),
+            "price_per_unit": round(rng.uniform(10, 1500), 2),
+        }
+        for _ in range(rng.randint(1, 100))
+    ]
+    return {
+        "order_id": f"ORD{rng.randint(1000, 9999)}",
+        "user_id": f"U{rng.randint(1000, 1005)}",
+        "order_timestamp": "2025-01-15T10:30:00Z",
+        "order_value": round(
+            sum(item["quantity"] * item["price_per_unit"] for item in items), 2
+        ),
+        "items": items,
+        "shipping_address": "123, Test Apartment, Test City, Test State",
+        "payment_method": "UPI",
+    }
+
+
+def dict_path(body: str):
+    order_data = json.loads(body)
+    order_id = order_data.get("order_id")
+    user_id = order_data.get("user_id")
+    order_value = order_data.get("order_value")
+    if not order_id or not order_id.startswith("ORD"):
+        return None
+    if not user_id or not user_id.startswith("U"):
+        return None
+    if not order_value or order_value <= 0:
+        return None
+
+    calculated_order_value = 0
+    for item in order_data.get("items", []):
+        calculated_order_value += item.get("quantity") * item.get("price_per_unit")
+    month_key = datetime.strptime(
+        order_data.get("order_timestamp"), "%Y-%m-%dT%H:%M:%SZ"
+    ).strftime("%Y-%m")
+    return user_id, round(calculated_order_value, 2), month_key
+
+
+def struct_path(body: str):
+    order_data = decode_order(body)
+    if not order_data.order_id.startswith("ORD"):
+        return None
+    if not order_data.user_id.startswith("U"):
+        return None
+    if order_data.order_value <= 0:
+        return None
+
+    calculated_order_value = 0
+    for item in order_data.items:
+        calculated_order_value += item.quantity * item.price_per_unit
+    month_key = order_data.order_timestamp.strftime("%Y-%m")
+    return order_data.user_id, round(calculated_order_value, 2), month_key
+
+
+def best_of(func, repeat: int):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    dicts = [sample_order(rng) for _ in range(args.messages)]
+    bodies = [json.dumps(order) for order in dicts]
+    structs = [order_decoder.decode(body) for body in bodies]
+    assert [dict_path(body) for body in bodies] == [
+        struct_path(body) for body in bodies
+    ]
+
+    results = [
+        (
+            "decode + validate",
+            best_of(lambda: [dict_path(body) for body in bodies], args.repeat),
+            best_of(lambda: [struct_path(body) for body in bodies], args.repeat),
+        ),
+        (
+            "encode",
+            best_of(lambda: [json.dumps(order) for order in dicts], args.repeat),
+            best_of(lambda: [encode_order(order) for order in structs], args.repeat),
+        ),
+    ]
+
+    print(f"{args.messages} messages, best of {args.repeat}")
+    print(f"{'stage':<20}{'json + dict':>14}{'msgspec':>14}{'speedup':>10}")
+    for stage, before, after in results:
+        print(
+            f"{stage:<20}"
+            f"{before / args.messages * 1e6:>11.1f} us"
+            f"{after / args.messages * 1e6:>11.1f} us"
+            f"{before / after:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+# Startup benchmark: how long a cold `import main` takes, how long
+# `python main.py` takes to answer /health/live and /health/ready, and how
+# long a forked consumer worker spends creating its SQS client, resolving the
+# queue URL and connecting to Redis, with the parent cold (nothing resolved
+# before the fork) and warm (as the app does before starting its workers).
+# The server and worker runs use SQS and Redis at the configured endpoints;
+# --import-only skips them. Prints a summary table to stderr and the results
+# as JSON to stdout (or --output).
+#
+#   cd sqs-server && python -m bench.startup --runs 5
+
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+IMPORT_SCRIPT = (
+    "import time; started = time.perf_counter(); import main; "
+    "print(time.perf_counter() - started)"
+)
+WORKER_STEPS = ("sqs_client", "queue_url", "redis")
+POLL_INTERVAL_SECONDS = 0.01
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--port", type=int, default=9100, help="port for the server runs"
+    )
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument(
+        "--import-only",
+        action="store_true",
+        help="skip the runs that need SQS and Redis",
+    )
+    parser.add_argument("--output", help="write the JSON results here")
+    return parser.parse_args()
+
+
+def median_ms(values: list):
+    return round(statistics.median(values) * 1000, 1) if values else None
+
+
+def subprocess_env(workdir: str, **overrides):
+    # Each run gets its own metrics directory, and the server's log files go
+    # to the working directory, so nothing lands in the tree.
+    return {
+        **os.environ,
+        "PYTHONPATH": str(SERVER_DIR),
+        "PROMETHEUS_MULTIPROC_DIR": os.path.join(workdir, "metrics"),
+        **overrides,
+    }
+
+
+def time_import(workdir: str):
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT],
+        cwd=workdir,
+        env=subprocess_env(workdir),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def wait_for(url: str, deadline: float):
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return True
+        except (urllib.error.URLError, ConnectionError, TimeoutError):
+            pass
+        time.sleep(POLL_INTERVAL_SECONDS)
+    return False
+
+
+def time_server(workdir: str, port: int, timeout: float):
+    # Seconds from launching `python main.py` until each probe answers 200,
+    # None if it did not within the timeout.
+    base_url = f"http://127.0.0.1:{port}/health"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, str(SERVER_DIR / "main.py")],
+        cwd=workdir,
+        env=subprocess_env(workdir, FASTAPI_PORT=str(port)),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + timeout
+        live = ready = None
+        if wait_for(f"{base_url}/live", deadline):
+            live = time.perf_counter() - started
+            if wait_for(f"{base_url}/ready", deadline):
+                ready = time.perf_counter() - started
+        return live, ready
+    finally:
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def worker_setup(connection):
+    # The steps Consumer.start runs before its first receive.
+    from consumer import Consumer
+
+    engine = Consumer()
+    timings = {}
+    started = time.perf_counter()
+    engine.get_sqs_client()
+    timings["sqs_client"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    engine.queue_url = engine.get_queue_url()
+    timings["queue_url"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    engine.get_redis_client().ping()
+    timings["redis"] = time.perf_counter() - started
+    connection.send(timings)
+
+
+def time_worker(context):
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=worker_setup, args=(sender,))
+    process.start()
+    timings = receiver.recv()
+    process.join()
+    return timings
+
+
+def time_workers(runs: int):
+    # Workers fork from this process, which has imported the app like the
+    # API has. Cold runs go first, before anything here touches SQS.
+    import main  # noqa: F401
+    from dlq import dead_letter_queue
+
+    context = multiprocessing.get_context("fork")
+    results = {}
+    for mode in ("cold", "warm"):
+        if mode == "warm":
+            dead_letter_queue.connect()
+        samples = [time_worker(context) for _ in range(runs)]
+        steps = {
+            step: median_ms([sample[step] for sample in samples])
+            for step in WORKER_STEPS
+        }
+        steps["total"] = median_ms([sum(sample.values()) for sample in samples])
+        results[mode] = steps
+    return results
+
+
+def run(args, workdir: str):
+    results = {
+        "config": vars(args),
+        "import_ms": median_ms([time_import(workdir) for _ in range(args.runs)]),
+    }
+    if args.import_only:
+        return results
+
+    server_runs = [
+        time_server(workdir, args.port, args.timeout) for _ in range(args.runs)
+    ]
+    results["server_ms"] = {
+        probe: median_ms([times[index] for times in server_runs if times[index]])
+        for index, probe in enumerate(("live", "ready"))
+    }
+    results["worker_setup_ms"] = time_workers(args.runs)
+    return results
+
+
+def print_summary(results: dict):
+    lines = [f"import    main in {results['import_ms']} ms"]
+    if "server_ms" in results:
+        server = results["server_ms"]
+        lines.append(
+            f"server    live in {server['live']} ms, ready in {server['ready']} ms"
+        )
+        for mode, steps in results["worker_setup_ms"].items():
+            lines.append(
+                f"worker    {mode} {steps['total']} ms ("
+                + ", ".join(f"{step} {steps[step]} ms" for step in WORKER_STEPS)
+                + ")"
+            )
+    print("\n".join(lines), file=sys.stderr)
+
+
+def main():
+    args = parse_args()
+    if args.output:
+        args.output = os.path.abspath(args.output)
+    workdir = tempfile.mkdtemp(prefix="sqs-bench-")
+    # The in-process worker runs import the app here too.
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = os.path.join(workdir, "metrics")
+    os.chdir(workdir)
+    results = run(args, workdir)
+    print_summary(results)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+
+from config import config
+from fastapi import Request, Response
+from redis_pool import get_async_redis
+
+
+class CacheEntry:
+    __slots__ = ("body", "etag", "version", "expires_at")
+
+    def __init__(self, body: bytes, version: int, expires_at: float):
+        self.body = body
+        self.etag = f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+        self.version = version
+        self.expires_at = expires_at
+
+
+class ResponseCache:
+    # LRU of rendered JSON bodies. Entries expire after STATS_CACHE_TTL_SECONDS
+    # and are dropped wholesale whenever a consumer announces a committed
+    # batch, so the TTL only bounds staleness if the pub/sub link is down.
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        entry = self.entries.get(key)
+        if (
+            entry is None
+            or entry.version != self.version
+            or entry.expires_at <= time.monotonic()
+        ):
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def set(self, key: str, body: bytes, version: int):
+        entry = CacheEntry(body, version, time.monotonic() + self.ttl)
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return entry
+
+    def invalidate(self):
+        self.version += 1
+        self.entries.clear()
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "version": self.version,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+response_cache = ResponseCache(
+    config.STATS_CACHE_MAX_ENTRIES, config.STATS_CACHE_TTL_SECONDS
+)
+
+
+def etag_matches(request: Request, etag: str):
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in candidates or "*" in candidates
+
+
+async def serve_cached(request: Request, key: str, loader):
+    if not config.STATS_CACHE_ENABLED:
+        return await loader()
+
+    entry = response_cache.get(key)
+    if entry is None:
+        # Remember the version we started from, so a batch committed while
+        # loading leaves this entry already stale.
+        version = response_cache.version
+        response = await loader()
+        if response.status_code != 200:
+            return response
+        entry = response_cache.set(key, response.body, version)
+
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+async def listen_for_invalidations():
+    while True:
+        try:
+            async with get_async_redis().pubsub() as pubsub:
+                await pubsub.subscribe(config.STATS_INVALIDATION_CHANNEL)
+                # Batches committed while we were not subscribed were never
+                # announced, so start every (re)connect from an empty cache.
+                response_cache.invalidate()
+
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        response_cache.invalidate()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Stats cache invalidation listener error: {e}")
+            await asyncio.sleep(1)
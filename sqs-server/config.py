@@ -15,9 +15,97 @@ class Config:
     SQS_WAIT_TIME_SECONDS = int(os.getenv("SQS_WAIT_TIME_SECONDS", 5))
     SQS_VISIBILITY_TIMEOUT = int(os.getenv("SQS_VISIBILITY_TIMEOUT", 30))
     SQS_MESSAGE_PROCESSING_DELAY = float(os.getenv("SQS_MESSAGE_PROCESSING_DELAY", 1))
+    SQS_ADAPTIVE_POLLING = os.getenv("SQS_ADAPTIVE_POLLING", "true").lower() == "true"
+    SQS_MAX_WAIT_TIME_SECONDS = int(os.getenv("SQS_MAX_WAIT_TIME_SECONDS", 20))
+    SQS_QUEUE_DEPTH_INTERVAL_SECONDS = float(
+        os.getenv("SQS_QUEUE_DEPTH_INTERVAL_SECONDS", 5)
+    )
+    SQS_ACK_FLUSH_POLICY = os.getenv("SQS_ACK_FLUSH_POLICY", "batch")
+    SQS_ACK_BATCH_SIZE = int(os.getenv("SQS_ACK_BATCH_SIZE", 10))
+    SQS_ACK_FLUSH_INTERVAL_MS = int(os.getenv("SQS_ACK_FLUSH_INTERVAL_MS", 1000))
+    SQS_ACK_MAX_RETRIES = int(os.getenv("SQS_ACK_MAX_RETRIES", 3))
+    SQS_VISIBILITY_HEARTBEAT_SECONDS = float(
+        os.getenv("SQS_VISIBILITY_HEARTBEAT_SECONDS", 10)
+    )
+    SQS_VISIBILITY_HEARTBEAT_MAX_SECONDS = float(
+        os.getenv("SQS_VISIBILITY_HEARTBEAT_MAX_SECONDS", 600)
+    )
+    SQS_RETRY_BACKOFF_SECONDS = int(os.getenv("SQS_RETRY_BACKOFF_SECONDS", 5))
+    SQS_RETRY_BACKOFF_MAX_SECONDS = int(os.getenv("SQS_RETRY_BACKOFF_MAX_SECONDS", 300))
+    SQS_DLQ_NAME = os.getenv("SQS_DLQ_NAME", f"{SQS_QUEUE_NAME}-dlq")
+    SQS_MAX_RECEIVE_COUNT = int(os.getenv("SQS_MAX_RECEIVE_COUNT", 5))
+    CONSUMER_MODE = os.getenv("CONSUMER_MODE", "sync")
+    CONSUMER_WORKERS = int(os.getenv("CONSUMER_WORKERS", os.cpu_count() or 1))
+    CONSUMER_RESTART_BACKOFF_SECONDS = float(
+        os.getenv("CONSUMER_RESTART_BACKOFF_SECONDS", 1)
+    )
+    CONSUMER_RESTART_BACKOFF_MAX_SECONDS = float(
+        os.getenv("CONSUMER_RESTART_BACKOFF_MAX_SECONDS", 60)
+    )
+    CONSUMER_SUPERVISOR_INTERVAL_SECONDS = float(
+        os.getenv("CONSUMER_SUPERVISOR_INTERVAL_SECONDS", 1)
+    )
+    CONSUMER_SHUTDOWN_TIMEOUT_SECONDS = float(
+        os.getenv("CONSUMER_SHUTDOWN_TIMEOUT_SECONDS", 30)
+    )
+    CONSUMER_ASYNC_RECEIVERS = int(os.getenv("CONSUMER_ASYNC_RECEIVERS", 4))
+    CONSUMER_ASYNC_CONCURRENCY = int(os.getenv("CONSUMER_ASYNC_CONCURRENCY", 8))
+    CONSUMER_ASYNC_QUEUE_SIZE = int(os.getenv("CONSUMER_ASYNC_QUEUE_SIZE", 8))
+    DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+    DEDUP_KEY = os.getenv("DEDUP_KEY", "message_id")
+    DEDUP_WINDOW_SECONDS = int(os.getenv("DEDUP_WINDOW_SECONDS", 3600))
+    DEDUP_MAX_RETRIES = int(os.getenv("DEDUP_MAX_RETRIES", 5))
+    AGGREGATION_ENABLED = os.getenv("AGGREGATION_ENABLED", "false").lower() == "true"
+    AGGREGATION_FLUSH_MESSAGES = int(os.getenv("AGGREGATION_FLUSH_MESSAGES", 500))
+    AGGREGATION_FLUSH_INTERVAL_MS = int(os.getenv("AGGREGATION_FLUSH_INTERVAL_MS", 1000))
+    ROLLUP_GRANULARITIES = os.getenv("ROLLUP_GRANULARITIES", "hour,day")
+    ROLLUP_HOUR_TTL_SECONDS = int(os.getenv("ROLLUP_HOUR_TTL_SECONDS", 7 * 24 * 3600))
+    ROLLUP_DAY_TTL_SECONDS = int(os.getenv("ROLLUP_DAY_TTL_SECONDS", 400 * 24 * 3600))
+    ROLLUP_MAX_POINTS = int(os.getenv("ROLLUP_MAX_POINTS", 1000))
+    SKETCHES_ENABLED = os.getenv("SKETCHES_ENABLED", "false").lower() == "true"
+    SKETCH_CMS_WIDTH = int(os.getenv("SKETCH_CMS_WIDTH", 1024))
+    SKETCH_CMS_DEPTH = int(os.getenv("SKETCH_CMS_DEPTH", 4))
+    SKETCH_TOPK_CAPACITY = int(os.getenv("SKETCH_TOPK_CAPACITY", 100))
+    SKETCH_QUANTILE_ACCURACY = float(os.getenv("SKETCH_QUANTILE_ACCURACY", 0.01))
+    ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "false").lower() == "true"
+    ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+    ARCHIVE_SEGMENT_MAX_BYTES = int(
+        os.getenv("ARCHIVE_SEGMENT_MAX_BYTES", 64 * 1024 * 1024)
+    )
+    REPLAY_WORKERS = int(os.getenv("REPLAY_WORKERS", os.cpu_count() or 1))
+    REPLAY_CHUNK_ORDERS = int(os.getenv("REPLAY_CHUNK_ORDERS", 10000))
+    PRODUCER_BATCH_SIZE = int(os.getenv("PRODUCER_BATCH_SIZE", 10))
+    PRODUCER_MAX_WORKERS = int(os.getenv("PRODUCER_MAX_WORKERS", 8))
+    PRODUCE_JOB_DEFAULT_RATE = float(os.getenv("PRODUCE_JOB_DEFAULT_RATE", 0))
+    PRODUCE_JOB_MAX_RUNNING = int(os.getenv("PRODUCE_JOB_MAX_RUNNING", 4))
+    PRODUCE_JOB_HISTORY = int(os.getenv("PRODUCE_JOB_HISTORY", 100))
     REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
     REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
     REDIS_DB = int(os.getenv("REDIS_DB", 0))
+    REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 50))
+    REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", 5))
+    REDIS_SOCKET_CONNECT_TIMEOUT = float(os.getenv("REDIS_SOCKET_CONNECT_TIMEOUT", 2))
+    REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 30))
+
+    USER_STATS_MAX_IDS = int(os.getenv("USER_STATS_MAX_IDS", 1000))
+
+    STATS_CACHE_ENABLED = os.getenv("STATS_CACHE_ENABLED", "true").lower() == "true"
+    STATS_CACHE_TTL_SECONDS = float(os.getenv("STATS_CACHE_TTL_SECONDS", 5))
+    STATS_CACHE_MAX_ENTRIES = int(os.getenv("STATS_CACHE_MAX_ENTRIES", 1024))
+    STATS_INVALIDATION_CHANNEL = os.getenv(
+        "STATS_INVALIDATION_CHANNEL", "stats:invalidate"
+    )
+    LOG_BUFFER_SIZE = int(os.getenv("LOG_BUFFER_SIZE", 500))
+    LOG_FLUSH_INTERVAL_MS = int(os.getenv("LOG_FLUSH_INTERVAL_MS", 500))
+    LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 50 * 1024 * 1024))
+    LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", 3))
+    LOG_READ_BLOCK_SIZE = int(os.getenv("LOG_READ_BLOCK_SIZE", 64 * 1024))
+    LOG_READ_MAX_SCAN_BYTES = int(
+        os.getenv("LOG_READ_MAX_SCAN_BYTES", 16 * 1024 * 1024)
+    )
+    PROMETHEUS_MULTIPROC_DIR = os.getenv(
+        "PROMETHEUS_MULTIPROC_DIR", "/tmp/sqs-server-metrics"
+    )
 
     FASTAPI_PORT = int(os.getenv("FASTAPI_PORT", 8000))
 
@@ -1,10 +1,136 @@
-import json
+import math
 import time
 
-import boto3
+import msgspec
+from aggregation import (
+    AggregationBuffer,
+    DeltaPipeline,
+    OrderTotals,
+    group_order_stats,
+)
+from archive import order_archive
 from config import config
+from dedup import dedup_window
+from dlq import ORIGINAL_MESSAGE_ID_ATTRIBUTE, get_queue_urls, original_message_id
 from logger import write_log
-from redis import Redis
+from metrics import (
+    ACK_STAGE,
+    COMMIT_STAGE,
+    PARSE_STAGE,
+    REDIS_PIPELINE_SECONDS,
+    REDIS_WATCH_RETRIES,
+    record_receive,
+)
+from polling import AdaptivePoller
+from redis import WatchError
+from redis_pool import get_redis
+from rollups import ROLLUP_TTLS, fold_rollups, hour_bucket, rollup_key
+from schema import Order, decode_order
+from sketches import SketchBatch, cms_cells, sketch_key
+from sqs_client import get_sqs_client
+from visibility import VisibilityHeartbeat, change_visibility, receive_count, retry_delay
+
+SQS_DELETE_BATCH_LIMIT = 10
+
+ORDER_COMMITTED = "committed"
+ORDER_DUPLICATE = "duplicate"
+ORDER_FAILED = "failed"
+
+
+def order_log_fields(order_data: Order):
+    return {"user_id": order_data.user_id, "order_id": order_data.order_id}
+
+
+class AckBatcher:
+    # Collects receipt handles and deletes them with DeleteMessageBatch.
+    # Policy "batch" flushes at the end of every received batch, policy
+    # "threshold" flushes once SQS_ACK_BATCH_SIZE acks are pending or the
+    # oldest pending ack is SQS_ACK_FLUSH_INTERVAL_MS old.
+    def __init__(self, sqs, queue_url: str):
+        self.sqs = sqs
+        self.queue_url = queue_url
+        self.policy = config.SQS_ACK_FLUSH_POLICY
+        self.batch_size = max(1, config.SQS_ACK_BATCH_SIZE)
+        self.flush_interval = config.SQS_ACK_FLUSH_INTERVAL_MS / 1000
+        self.max_retries = config.SQS_ACK_MAX_RETRIES
+        self.pending = []
+        self.oldest_pending_at = None
+
+    def add(self, message: dict, label: str = ""):
+        self.queue(message, label)
+        if self.policy == "threshold" and self.is_due():
+            self.flush()
+
+    def queue(self, message: dict, label: str = ""):
+        # Adds an ack without flushing, for callers that delete off-thread.
+        if not self.pending:
+            self.oldest_pending_at = time.monotonic()
+        self.pending.append((message["ReceiptHandle"], label))
+
+    def is_due(self):
+        if not self.pending:
+            return False
+        if len(self.pending) >= self.batch_size:
+            return True
+        return time.monotonic() - self.oldest_pending_at >= self.flush_interval
+
+    def time_until_due(self):
+        if not self.pending:
+            return None
+        return max(0, self.oldest_pending_at + self.flush_interval - time.monotonic())
+
+    def flush_after_batch(self):
+        return self.policy == "batch" or self.is_due()
+
+    def end_of_batch(self):
+        if self.flush_after_batch():
+            self.flush()
+
+    def take(self):
+        pending, self.pending = self.pending, []
+        self.oldest_pending_at = None
+        return pending
+
+    def flush(self):
+        self.delete_entries(self.take())
+
+    def delete_entries(self, entries: list):
+        for offset in range(0, len(entries), SQS_DELETE_BATCH_LIMIT):
+            self.delete_batch(entries[offset : offset + SQS_DELETE_BATCH_LIMIT])
+
+    def delete_batch(self, entries: list):
+        attempt = 0
+        while entries:
+            try:
+                response = self.sqs.delete_message_batch(
+                    QueueUrl=self.queue_url,
+                    Entries=[
+                        {"Id": str(idx), "ReceiptHandle": receipt_handle}
+                        for idx, (receipt_handle, _) in enumerate(entries)
+                    ],
+                )
+                failed = response.get("Failed", [])
+            except Exception as e:
+                failed = [
+                    {"Id": str(idx), "SenderFault": False, "Message": str(e)}
+                    for idx in range(len(entries))
+                ]
+
+            retryable = []
+            for failure in failed:
+                receipt_handle, label = entries[int(failure["Id"])]
+                if failure.get("SenderFault") or attempt >= self.max_retries:
+                    write_log(
+                        f"[ACK ERROR] {label} Failed to delete message: {failure.get('Code', '')} {failure.get('Message', '')}, message may be redelivered",
+                        level="ERROR",
+                    )
+                else:
+                    retryable.append((receipt_handle, label))
+
+            entries = retryable
+            attempt += 1
+            if entries:
+                time.sleep(0.1 * 2**attempt)
 
 
 class Consumer:
@@ -12,230 +138,509 @@ class Consumer:
         self.sqs = None
         self.queue_url = None
         self.redis_client = None
+        self.acks = None
+        self.heartbeat = None
+        self.aggregation = None
+        self.poller = None
 
     def get_sqs_client(self):
-        self.sqs = boto3.client(
-            "sqs",
-            region_name=config.AWS_REGION,
-            endpoint_url=config.AWS_ENDPOINT_URL,
-            aws_access_key_id=config.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=config.AWS_SECRET_ACCESS_KEY,
-        )
+        self.sqs = get_sqs_client()
         return self.sqs
 
     def get_queue_url(self):
         try:
-            response = self.sqs.create_queue(QueueName=config.SQS_QUEUE_NAME)
-            return response["QueueUrl"]
+            queue_url, _ = get_queue_urls(self.sqs)
+            return queue_url
         except Exception as e:
             raise Exception(f"Failed to get queue URL: {e}")
 
     def get_redis_client(self):
-        self.redis_client = Redis(
-            host=config.REDIS_HOST,
-            port=config.REDIS_PORT,
-            db=config.REDIS_DB,
-        )
+        self.redis_client = get_redis()
         return self.redis_client
 
-    def validate_order_data(self, order_data: dict):
-        order_id = order_data.get("order_id")
-        user_id = order_data.get("user_id")
-        order_value = order_data.get("order_value")
+    def validate_order_data(self, order_data: Order):
+        order_id = order_data.order_id
+        user_id = order_data.user_id
+        order_value = order_data.order_value
 
         if not order_id or not order_id.startswith("ORD"):
-            write_log(f"[ERROR] Invalid/missing order ID: {order_id}, skipping order")
+            write_log(
+                f"[ERROR] Invalid/missing order ID: {order_id}, skipping order",
+                level="ERROR",
+                **order_log_fields(order_data),
+            )
             return False
         if not user_id or not user_id.startswith("U"):
-            write_log(f"[ERROR] Invalid/missing user ID: {user_id}, skipping order")
+            write_log(
+                f"[ERROR] Invalid/missing user ID: {user_id}, skipping order",
+                level="ERROR",
+                **order_log_fields(order_data),
+            )
             return False
         if not order_value or order_value <= 0:
             write_log(
-                f"[ERROR] Invalid/missing order value: {order_value}, skipping order"
+                f"[ERROR] Invalid/missing order value: {order_value}, skipping order",
+                level="ERROR",
+                **order_log_fields(order_data),
             )
             return False
 
         calculated_order_value = 0
-        for item in order_data.get("items", []):
-            calculated_order_value += item.get("quantity") * item.get("price_per_unit")
+        for item in order_data.items:
+            calculated_order_value += item.quantity * item.price_per_unit
 
         if round(calculated_order_value, 2) != round(order_value, 2):
             write_log(
-                f"[ERROR] Order value mismatch: {round(calculated_order_value, 2)} != {round(order_value, 2)}, fixing with correct value"
+                f"[ERROR] Order value mismatch: {round(calculated_order_value, 2)} != {round(order_value, 2)}, fixing with correct value",
+                level="ERROR",
+                **order_log_fields(order_data),
             )
 
-            order_data["order_value"] = calculated_order_value
+            order_data.order_value = calculated_order_value
         return True
 
-    def handle_userwise_stats(self, order_data: dict, is_failed: bool = False):
-        try:
-            user_id = order_data.get("user_id")
-            order_value = round(float(order_data.get("order_value", 0)), 2)
-            redis_key = f"user:{user_id}"
-
-            if is_failed:
-                self.redis_client.hincrby(redis_key, "failed_order_count", 1)
-            else:
-                self.redis_client.hincrby(redis_key, "order_count", 1)
-                self.redis_client.hincrbyfloat(redis_key, "total_spend", order_value)
-
-                self.redis_client.zincrby(
-                    "user_ranking:total_spend", order_value, user_id
-                )
-                self.redis_client.zincrby("user_ranking:total_order_count", 1, user_id)
-
-            return True
-
-        except Exception as e:
-            write_log(f"[REDIS ERROR] Failed to update user stats: {e}")
-            return False
-
-    def handle_global_stats(self, order_data: dict, is_failed: bool = False):
-        try:
-            global_hash_key = "global:stats"
-            order_value = round(float(order_data.get("order_value", 0)), 2)
-
-            if is_failed:
-                self.redis_client.hincrby(global_hash_key, "failed_orders", 1)
-            else:
-                self.redis_client.hincrby(global_hash_key, "total_orders", 1)
-                self.redis_client.hincrbyfloat(
-                    global_hash_key, "total_revenue", order_value
-                )
-
-            return True
-        except Exception as e:
-            write_log(f"[REDIS ERROR] Failed to update global stats: {e}")
-            return False
-
-    def handle_monthly_aggregation(self, order_data: dict, is_failed: bool = False):
-        try:
-            from datetime import datetime
-
-            user_id = order_data.get("user_id")
-            order_value = round(float(order_data.get("order_value", 0)), 2)
-            order_timestamp = order_data.get("order_timestamp")
-
-            dt = datetime.strptime(order_timestamp, "%Y-%m-%dT%H:%M:%SZ")
-            month_key = dt.strftime("%Y-%m")
-
-            monthly_key = f"monthly:{month_key}"
+    def prepare_order_stats(self, order_data: Order):
+        user_id = order_data.user_id
+        order_value = round(float(order_data.order_value or 0), 2)
+        hour_key = hour_bucket(order_data.order_timestamp)
+        month_key = hour_key[:7]
+
+        return user_id, order_value, month_key, hour_key
+
+    def handle_userwise_stats(self, pipe, user_id: str, totals: OrderTotals):
+        # An order without a user ID only counts in the global, monthly and
+        # rollup totals; it is always failed, so no ranking misses it.
+        if user_id is None:
+            return
+        redis_key = f"user:{user_id}"
+
+        if totals.failed_order_count:
+            pipe.hincrby(redis_key, "failed_order_count", totals.failed_order_count)
+        if totals.order_count:
+            pipe.hincrby(redis_key, "order_count", totals.order_count)
+            pipe.hincrbyfloat(redis_key, "total_spend", totals.total_spend)
+
+            pipe.zincrby("user_ranking:total_spend", totals.total_spend, user_id)
+            pipe.zincrby("user_ranking:total_order_count", totals.order_count, user_id)
+
+    def handle_global_stats(self, pipe, totals: OrderTotals):
+        global_hash_key = "global:stats"
+
+        if totals.failed_order_count:
+            pipe.hincrby(global_hash_key, "failed_orders", totals.failed_order_count)
+        if totals.order_count:
+            pipe.hincrby(global_hash_key, "total_orders", totals.order_count)
+            pipe.hincrbyfloat(global_hash_key, "total_revenue", totals.total_spend)
+
+    def handle_rollup_stats(self, pipe, hourly: dict):
+        # Hour and day buckets are summed from the batch's hourly totals and
+        # expire ROLLUP_*_TTL_SECONDS after their last write, which bounds how
+        # many fine-grained buckets are kept. Month buckets are the monthly
+        # totals, which never expire.
+        for (granularity, bucket), totals in fold_rollups(hourly).items():
+            redis_key = rollup_key(granularity, bucket)
+
+            if totals.failed_order_count:
+                pipe.hincrby(redis_key, "failed_orders", totals.failed_order_count)
+            if totals.order_count:
+                pipe.hincrby(redis_key, "total_orders", totals.order_count)
+                pipe.hincrbyfloat(redis_key, "total_revenue", totals.total_spend)
+            if ROLLUP_TTLS[granularity]:
+                pipe.expire(redis_key, ROLLUP_TTLS[granularity])
+
+    def handle_sketches(self, pipe, sketches: SketchBatch):
+        # HyperLogLogs of unique users and orders, Count-Min sketches with
+        # top-K candidates per dimension and log-bucketed order values, per
+        # month. None of them grows with the number of users or products.
+        for month_key, user_ids in sketches.users.items():
+            pipe.pfadd(sketch_key(month_key, "users"), *user_ids)
+        for month_key, order_ids in sketches.orders.items():
+            pipe.pfadd(sketch_key(month_key, "orders"), *order_ids)
+
+        for (month_key, dimension), counts in sketches.counts.items():
+            cms_key = sketch_key(month_key, f"cms:{dimension}")
+            top_key = sketch_key(month_key, f"top:{dimension}")
+            for item, count in counts.items():
+                for cell in cms_cells(item):
+                    pipe.hincrby(cms_key, cell, count)
+                pipe.zincrby(top_key, count, item)
+            # Candidates that drop out lose their sorted set score but not
+            # their Count-Min counts, which is what the top-K is ranked by. An
+            # item that only turns frequent once the set is full can be
+            # missed, so SKETCH_TOPK_CAPACITY should be well above any k read.
+            pipe.zremrangebyrank(top_key, 0, -config.SKETCH_TOPK_CAPACITY - 1)
+
+        for month_key, buckets in sketches.value_buckets.items():
+            value_key = sketch_key(month_key, "order_value")
+            for bucket, count in buckets.items():
+                pipe.hincrby(value_key, bucket, count)
+
+    def handle_monthly_aggregation(
+        self, pipe, user_id: str, month_key: str, totals: OrderTotals
+    ):
+        monthly_key = f"monthly:{month_key}"
+
+        # Besides the per-user hashes, each month keeps an index of its users,
+        # its totals and spend/order rankings, so the monthly endpoint never
+        # has to scan the keyspace. Users with only failed orders still get a
+        # zero score, so they show up in the month's ranking.
+        if totals.failed_order_count:
+            pipe.hincrby(
+                f"{monthly_key}:totals", "failed_orders", totals.failed_order_count
+            )
+        if totals.order_count:
+            pipe.hincrby(f"{monthly_key}:totals", "total_orders", totals.order_count)
+            pipe.hincrbyfloat(
+                f"{monthly_key}:totals", "total_revenue", totals.total_spend
+            )
+        pipe.sadd("months:list", month_key)
+        if user_id is None:
+            return
+
+        if totals.failed_order_count:
+            pipe.hincrby(
+                f"{monthly_key}:user:{user_id}",
+                "failed_order_count",
+                totals.failed_order_count,
+            )
+        if totals.order_count:
+            pipe.hincrbyfloat(
+                f"{monthly_key}:user:{user_id}", "total_spend", totals.total_spend
+            )
+            pipe.hincrby(
+                f"{monthly_key}:user:{user_id}", "order_count", totals.order_count
+            )
+        pipe.zincrby(f"{monthly_key}:ranking:total_spend", totals.total_spend, user_id)
+        pipe.zincrby(
+            f"{monthly_key}:ranking:total_order_count", totals.order_count, user_id
+        )
+        pipe.sadd(f"{monthly_key}:users", user_id)
+
+    def queue_redis_updates(self, pipe, orders: list, seen: set = frozenset()):
+        # Classifies the whole batch first, then queues stats once per
+        # (user, month) group rather than once per order.
+        statuses = [ORDER_FAILED] * len(orders)
+        committed_digests = []
+        seen = set(seen)
+        rows = []
+        sketches = SketchBatch() if config.SKETCHES_ENABLED else None
+
+        for idx, (order_data, is_failed, digest) in enumerate(orders):
+            if digest is not None and digest in seen:
+                statuses[idx] = ORDER_DUPLICATE
+                continue
 
-            if is_failed:
-                self.redis_client.hincrby(
-                    f"{monthly_key}:user:{user_id}", "failed_order_count", 1
-                )
-            else:
-                self.redis_client.hincrbyfloat(
-                    f"{monthly_key}:user:{user_id}", "total_spend", order_value
-                )
-                self.redis_client.hincrby(
-                    f"{monthly_key}:user:{user_id}", "order_count", 1
+            try:
+                user_id, order_value, month_key, hour_key = self.prepare_order_stats(
+                    order_data
                 )
-
-            self.redis_client.sadd("months:list", month_key)
-
-            return True
-
-        except Exception as e:
-            write_log(f"[REDIS ERROR] Failed to update monthly aggregation: {e}")
-            return False
-
-    def handle_redis_db_insertion(self, order_data: dict, is_failed: bool = False):
-        try:
-            userwise_stats_result = self.handle_userwise_stats(order_data, is_failed)
-            if not userwise_stats_result:
+            except Exception as e:
                 write_log(
-                    f"[REDIS ERROR] Failed to update user stats for user {order_data.get('user_id')}"
+                    f"[REDIS ERROR] Failed to prepare stats for order {order_data.order_id}: {e}",
+                    level="ERROR",
+                    **order_log_fields(order_data),
                 )
-                return False
-
-            global_stats_result = self.handle_global_stats(order_data, is_failed)
-            if not global_stats_result:
-                write_log("[REDIS ERROR] Failed to update global stats")
-                return False
-
-            monthly_aggregation_result = self.handle_monthly_aggregation(
-                order_data, is_failed
+                continue
+
+            rows.append((user_id, order_value, month_key, hour_key, is_failed))
+            if sketches and not is_failed:
+                sketches.add(month_key, order_data, order_value)
+            statuses[idx] = ORDER_COMMITTED
+            if digest is not None:
+                committed_digests.append(digest)
+                seen.add(digest)
+
+        groups, hourly, overall = group_order_stats(rows)
+        for (user_id, month_key), totals in groups.items():
+            self.handle_userwise_stats(pipe, user_id, totals)
+            self.handle_monthly_aggregation(pipe, user_id, month_key, totals)
+        if rows:
+            self.handle_global_stats(pipe, overall)
+            self.handle_rollup_stats(pipe, hourly)
+        if sketches:
+            self.handle_sketches(pipe, sketches)
+
+        if ORDER_COMMITTED in statuses:
+            # Published inside the transaction, so API caches are told about
+            # exactly the batches that were committed.
+            pipe.publish(config.STATS_INVALIDATION_CHANNEL, "batch")
+
+        return statuses, committed_digests
+
+    def queue_merged_updates(self, pipe, orders: list, seen: set = frozenset()):
+        deltas = DeltaPipeline()
+        statuses, committed_digests = self.queue_redis_updates(deltas, orders, seen)
+        deltas.apply(pipe)
+        return statuses, committed_digests
+
+    def dedup_id(self, message: dict, order_data: Order):
+        if config.DEDUP_KEY == "order_id":
+            return order_data.order_id
+        return original_message_id(message)
+
+    def with_digests(self, orders: list):
+        return [
+            (
+                order_data,
+                is_failed,
+                dedup_window.digest(dedup_id)
+                if config.DEDUP_ENABLED and dedup_id
+                else None,
             )
-            if not monthly_aggregation_result:
-                write_log("[REDIS ERROR] Failed to update monthly aggregation")
-                return False
-
-            return True
+            for order_data, is_failed, dedup_id in orders
+        ]
+
+    def handle_redis_db_insertion(self, orders: list):
+        # All updates for a received batch are queued on one MULTI/EXEC
+        # pipeline, so the batch is applied in a single round trip and either
+        # every counter moves or none do. With dedup enabled the batch's dedup
+        # keys are WATCHed while they are checked, so a message committed
+        # concurrently by another consumer aborts the EXEC and is re-checked.
+        orders = self.with_digests(orders)
+        digests = [digest for _, _, digest in orders if digest is not None]
+
+        for _ in range(config.DEDUP_MAX_RETRIES + 1):
+            try:
+                with self.redis_client.pipeline(transaction=True) as pipe:
+                    seen = set()
+                    if digests:
+                        keys = dedup_window.keys(digests)
+                        pipe.watch(*keys)
+                        seen = dedup_window.collect_seen(pipe.mget(keys), digests)
+                        pipe.multi()
+
+                    statuses, committed_digests = self.queue_merged_updates(
+                        pipe, orders, seen
+                    )
+                    if committed_digests:
+                        dedup_window.queue_mark(pipe, committed_digests)
+                    if ORDER_COMMITTED in statuses:
+                        pipe.execute()
+                    return statuses
+
+            except WatchError:
+                REDIS_WATCH_RETRIES.inc()
+                continue
+            except Exception as e:
+                write_log(f"[REDIS ERROR] Failed to update Redis DB: {e}", level="ERROR")
+                return [ORDER_FAILED] * len(orders)
 
-        except Exception as e:
-            write_log(f"[REDIS ERROR] Failed to update Redis DB: {e}")
-            return False
+        write_log(
+            "[REDIS ERROR] Dedup keys kept changing during commit, will retry batch",
+            level="ERROR",
+        )
+        return [ORDER_FAILED] * len(orders)
 
-    def handle_message(self, messages: list):
+    def parse_messages(self, messages: list):
+        pending = []
+        acks = []
         for message in messages:
             try:
-                order_data = json.loads(message["Body"])
-                log_msg = f"[USER: {order_data.get('user_id')}] [ORDER: {order_data.get('order_id')}] Received"
-                write_log(log_msg)
+                order_data = decode_order(message["Body"])
+                log_msg = f"[USER: {order_data.user_id}] [ORDER: {order_data.order_id}] Received"
+                write_log(log_msg, **order_log_fields(order_data))
 
                 validation_result = self.validate_order_data(order_data)
                 if not validation_result:
                     write_log(
-                        f"[USER: {order_data.get('user_id')}] [ORDER: {order_data.get('order_id')}] Validation failed, tracking as failed order"
-                    )
-                    self.handle_redis_db_insertion(order_data, is_failed=True)
-                    self.sqs.delete_message(
-                        QueueUrl=self.queue_url,
-                        ReceiptHandle=message["ReceiptHandle"],
+                        f"[USER: {order_data.user_id}] [ORDER: {order_data.order_id}] Validation failed, tracking as failed order",
+                        level="WARNING",
+                        **order_log_fields(order_data),
                     )
-                    continue
+                pending.append((message, order_data, not validation_result))
+
+            except (msgspec.DecodeError, KeyError) as e:
+                write_log(f"[ERROR] Error processing message: {e}", level="ERROR")
+                acks.append((message, f"[MESSAGE: {message.get('MessageId')}]"))
+
+        return pending, acks
+
+    def archive_orders(self, pending: list, statuses: list):
+        if config.ARCHIVE_ENABLED:
+            order_archive.archive_committed(
+                [
+                    (order_data, is_failed)
+                    for (_, order_data, is_failed), status in zip(pending, statuses)
+                    if status == ORDER_COMMITTED
+                ]
+            )
 
-                redis_result = self.handle_redis_db_insertion(
-                    order_data, is_failed=False
+    def collect_acks(self, pending: list, statuses: list):
+        acks = []
+        retries = []
+        for (message, order_data, is_failed), status in zip(pending, statuses):
+            label = f"[USER: {order_data.user_id}] [ORDER: {order_data.order_id}]"
+            if status == ORDER_FAILED:
+                attempt = receive_count(message)
+                max_attempts = config.SQS_MAX_RECEIVE_COUNT
+                if max_attempts and attempt >= max_attempts:
+                    retry_note = "moving to dead-letter queue on next receive"
+                else:
+                    retry_note = f"retrying in {retry_delay(message)}s"
+                write_log(
+                    f"{label} Redis insertion failed on attempt {attempt}, {retry_note}",
+                    level="ERROR",
+                    **order_log_fields(order_data),
                 )
-                if not redis_result:
-                    write_log(
-                        f"[USER: {order_data.get('user_id')}] [ORDER: {order_data.get('order_id')}] Redis insertion failed, will retry"
-                    )
-                    continue
+                retries.append((message, label))
+                continue
 
+            if status == ORDER_DUPLICATE:
                 write_log(
-                    f"[USER: {order_data.get('user_id')}] [ORDER: {order_data.get('order_id')}] Processed successfully"
+                    f"[USER: {order_data.user_id}] [ORDER: {order_data.order_id}] Duplicate delivery, already processed",
+                    level="WARNING",
+                    **order_log_fields(order_data),
                 )
-
-                self.sqs.delete_message(
-                    QueueUrl=self.queue_url,
-                    ReceiptHandle=message["ReceiptHandle"],
+            elif not is_failed:
+                write_log(
+                    f"[USER: {order_data.user_id}] [ORDER: {order_data.order_id}] Processed successfully",
+                    **order_log_fields(order_data),
                 )
 
-            except (json.JSONDecodeError, KeyError) as e:
-                write_log(f"[ERROR] Error processing message: {e}")
-                self.sqs.delete_message(
-                    QueueUrl=self.queue_url,
-                    ReceiptHandle=message["ReceiptHandle"],
-                )
+            acks.append((message, label))
+
+        return acks, retries
+
+    def retry_later(self, retries: list):
+        # Instead of waiting out the full visibility timeout, a failed message
+        # comes back after an exponential backoff.
+        change_visibility(
+            self.sqs,
+            self.queue_url,
+            [
+                (message["ReceiptHandle"], retry_delay(message), label)
+                for message, label in retries
+            ],
+        )
 
-    def start(self):
+    def receive_request(self):
+        return {
+            "QueueUrl": self.queue_url,
+            "MaxNumberOfMessages": config.SQS_MAX_NUMBER_OF_MESSAGES,
+            "WaitTimeSeconds": self.poller.wait_time,
+            "VisibilityTimeout": config.SQS_VISIBILITY_TIMEOUT,
+            "AttributeNames": ["ApproximateReceiveCount", "SentTimestamp"],
+            "MessageAttributeNames": [ORIGINAL_MESSAGE_ID_ATTRIBUTE],
+        }
+
+    def commit_orders(self, pending: list, tokens: list):
+        acks = []
+        retries = []
+        try:
+            if pending:
+                orders = [
+                    (order_data, is_failed, self.dedup_id(message, order_data))
+                    for message, order_data, is_failed in pending
+                ]
+                with REDIS_PIPELINE_SECONDS.time():
+                    statuses = self.handle_redis_db_insertion(orders)
+                self.archive_orders(pending, statuses)
+                acks, retries = self.collect_acks(pending, statuses)
+        finally:
+            for token in tokens:
+                self.heartbeat.release(token)
+
+        if retries:
+            self.retry_later(retries)
+        for message, label in acks:
+            self.acks.add(message, label)
+
+    def flush_aggregation(self):
+        pending, tokens = self.aggregation.take()
+        if pending or tokens:
+            self.commit_orders(pending, tokens)
+
+    def handle_message(self, messages: list):
+        token = self.heartbeat.track(messages)
+        try:
+            with PARSE_STAGE.time():
+                pending, acks = self.parse_messages(messages)
+        except Exception:
+            self.heartbeat.release(token)
+            raise
+
+        if acks:
+            # Undecodable messages are acked now; stop extending them.
+            self.heartbeat.release(token, [message for message, _ in acks])
+        for message, label in acks:
+            self.acks.add(message, label)
+
+        with COMMIT_STAGE.time():
+            if self.aggregation:
+                # Orders wait in the buffer, still invisible thanks to the
+                # heartbeat, and are acked only once their flush has committed.
+                self.aggregation.add(pending, token)
+                if self.aggregation.is_due():
+                    self.flush_aggregation()
+            else:
+                self.commit_orders(pending, [token])
+        with ACK_STAGE.time():
+            self.acks.end_of_batch()
+
+    def start(self, stop_event=None, stats=None):
         if not self.sqs:
             self.sqs = self.get_sqs_client()
         if not self.queue_url:
             self.queue_url = self.get_queue_url()
         if not self.redis_client:
             self.redis_client = self.get_redis_client()
-
-        while True:
+        if not self.acks:
+            self.acks = AckBatcher(self.sqs, self.queue_url)
+        if not self.heartbeat:
+            self.heartbeat = VisibilityHeartbeat(self.sqs, self.queue_url)
+        self.heartbeat.start()
+        if config.AGGREGATION_ENABLED and not self.aggregation:
+            self.aggregation = AggregationBuffer()
+        if not self.poller:
+            self.poller = AdaptivePoller()
+
+        while not (stop_event and stop_event.is_set()):
             try:
-                response = self.sqs.receive_message(
-                    QueueUrl=self.queue_url,
-                    MaxNumberOfMessages=config.SQS_MAX_NUMBER_OF_MESSAGES,
-                    WaitTimeSeconds=config.SQS_WAIT_TIME_SECONDS,
-                    VisibilityTimeout=config.SQS_VISIBILITY_TIMEOUT,
-                )
-                if "Messages" in response:
-                    self.handle_message(response["Messages"])
-                else:
+                if self.aggregation and self.aggregation.is_due():
+                    self.flush_aggregation()
+                    self.acks.end_of_batch()
+                if self.acks.is_due():
+                    self.acks.flush()
+
+                request = self.receive_request()
+                if self.aggregation and self.aggregation.pending:
+                    # Don't let a long poll hold buffered orders past their
+                    # flush deadline.
+                    request["WaitTimeSeconds"] = min(
+                        request["WaitTimeSeconds"],
+                        math.ceil(self.aggregation.time_until_due()),
+                    )
+                if self.acks.pending:
+                    # Nor pending acks past theirs, now that idle polls grow.
+                    request["WaitTimeSeconds"] = min(
+                        request["WaitTimeSeconds"],
+                        math.ceil(self.acks.time_until_due()),
+                    )
+                started = time.perf_counter()
+                response = self.sqs.receive_message(**request)
+                elapsed = time.perf_counter() - started
+                messages = response.get("Messages", [])
+                record_receive(elapsed, messages, request["MaxNumberOfMessages"])
+                self.poller.record_receive(elapsed, len(messages))
+                if stats:
+                    stats.beat()
+                if messages:
+                    self.handle_message(messages)
+                    if stats:
+                        stats.record(len(messages))
+                elif not self.poller.wait_time:
+                    # Only short polling needs a pause between empty
+                    # receives; a long poll has already waited.
                     time.sleep(float(config.SQS_MESSAGE_PROCESSING_DELAY))
 
             except Exception as e:
-                write_log(f"[ERROR] Error receiving messages: {e}")
+                write_log(f"[ERROR] Error receiving messages: {e}", level="ERROR")
                 time.sleep(float(config.SQS_MESSAGE_PROCESSING_DELAY))
 
+        if self.aggregation:
+            self.flush_aggregation()
+        self.acks.flush()
+        self.heartbeat.stop()
+
 
 consumer = Consumer()
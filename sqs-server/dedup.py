@@ -0,0 +1,28 @@
+import hashlib
+
+from config import config
+
+
+class DedupWindow:
+    # Every processed message ID is kept as its own key, named after an
+    # 8-byte digest of the ID, that expires after DEDUP_WINDOW_SECONDS.
+    # A commit WATCHes only the keys of its own messages, so concurrent
+    # commits only conflict when they really carry the same message.
+    def __init__(self):
+        self.window_seconds = config.DEDUP_WINDOW_SECONDS
+
+    def digest(self, dedup_id: str):
+        return hashlib.blake2b(dedup_id.encode("utf-8"), digest_size=8).hexdigest()
+
+    def keys(self, digests: list):
+        return [f"dedup:{digest}" for digest in digests]
+
+    def collect_seen(self, values: list, digests: list):
+        return {digest for digest, value in zip(digests, values) if value is not None}
+
+    def queue_mark(self, pipe, digests: list):
+        for key in self.keys(digests):
+            pipe.set(key, 1, ex=self.window_seconds)
+
+
+dedup_window = DedupWindow()
@@ -0,0 +1,214 @@
+import json
+
+from config import config
+from logger import write_log
+from metrics import QUEUE_ATTRIBUTES
+from sqs_client import get_sqs_client
+from visibility import change_visibility, receive_count
+
+SQS_BATCH_LIMIT = 10
+ORIGINAL_MESSAGE_ID_ATTRIBUTE = "OriginalMessageId"
+
+queue_urls = None
+
+
+def provision_queues(sqs):
+    # Creates the orders queue and its dead-letter queue and points the
+    # queue's redrive policy at it, so a message received more than
+    # SQS_MAX_RECEIVE_COUNT times is moved aside instead of being retried
+    # forever. Safe to run from every process on startup.
+    dlq_url = sqs.create_queue(QueueName=config.SQS_DLQ_NAME)["QueueUrl"]
+    queue_url = sqs.create_queue(QueueName=config.SQS_QUEUE_NAME)["QueueUrl"]
+
+    if config.SQS_MAX_RECEIVE_COUNT > 0:
+        dlq_arn = sqs.get_queue_attributes(
+            QueueUrl=dlq_url, AttributeNames=["QueueArn"]
+        )["Attributes"]["QueueArn"]
+        sqs.set_queue_attributes(
+            QueueUrl=queue_url,
+            Attributes={
+                "RedrivePolicy": json.dumps(
+                    {
+                        "deadLetterTargetArn": dlq_arn,
+                        "maxReceiveCount": str(config.SQS_MAX_RECEIVE_COUNT),
+                    }
+                )
+            },
+        )
+
+    return queue_url, dlq_url
+
+
+def get_queue_urls(sqs):
+    # Provisions once and keeps the URLs. Module state survives a fork, so
+    # consumer workers started after the app resolved them skip the round
+    # trips.
+    global queue_urls
+    if queue_urls is None:
+        queue_urls = provision_queues(sqs)
+    return queue_urls
+
+
+def original_message_id(message: dict):
+    attribute = message.get("MessageAttributes", {}).get(ORIGINAL_MESSAGE_ID_ATTRIBUTE)
+    if attribute:
+        return attribute.get("StringValue")
+    return message.get("MessageId")
+
+
+def describe_dead_letter(message: dict):
+    try:
+        body = json.loads(message["Body"])
+    except json.JSONDecodeError:
+        body = message["Body"]
+
+    attributes = message.get("Attributes", {})
+    return {
+        "message_id": original_message_id(message),
+        "receive_count": receive_count(message),
+        "sent_timestamp": int(attributes["SentTimestamp"])
+        if "SentTimestamp" in attributes
+        else None,
+        "body": body,
+    }
+
+
+class DeadLetterQueue:
+    def __init__(self):
+        self.sqs = None
+        self.queue_url = None
+        self.dlq_url = None
+
+    def connect(self):
+        if not self.sqs:
+            self.sqs = get_sqs_client()
+        if not self.dlq_url:
+            self.queue_url, self.dlq_url = get_queue_urls(self.sqs)
+
+    def receive(self, count: int):
+        response = self.sqs.receive_message(
+            QueueUrl=self.dlq_url,
+            MaxNumberOfMessages=min(count, SQS_BATCH_LIMIT),
+            WaitTimeSeconds=1,
+            VisibilityTimeout=config.SQS_VISIBILITY_TIMEOUT,
+            AttributeNames=["ApproximateReceiveCount", "SentTimestamp"],
+            MessageAttributeNames=[ORIGINAL_MESSAGE_ID_ATTRIBUTE],
+        )
+        return response.get("Messages", [])
+
+    def make_visible(self, messages: list):
+        change_visibility(
+            self.sqs,
+            self.dlq_url,
+            [(message["ReceiptHandle"], 0, "[DLQ]") for message in messages],
+        )
+
+    def queue_attributes(self, queue_url: str):
+        return self.sqs.get_queue_attributes(
+            QueueUrl=queue_url, AttributeNames=list(QUEUE_ATTRIBUTES)
+        )["Attributes"]
+
+    def approximate_size(self):
+        attributes = self.queue_attributes(self.dlq_url)
+        return {
+            "visible": int(attributes.get("ApproximateNumberOfMessages", 0)),
+            "in_flight": int(attributes.get("ApproximateNumberOfMessagesNotVisible", 0)),
+        }
+
+    def queue_depths(self):
+        self.connect()
+        return {
+            config.SQS_QUEUE_NAME: self.queue_attributes(self.queue_url),
+            config.SQS_DLQ_NAME: self.queue_attributes(self.dlq_url),
+        }
+
+    def inspect(self, limit: int = 10):
+        # Messages are received to be read and then made visible again right
+        # away, so inspecting never delays a replay.
+        self.connect()
+        messages = {}
+        while len(messages) < limit:
+            received = [
+                message
+                for message in self.receive(limit - len(messages))
+                if message["MessageId"] not in messages
+            ]
+            if not received:
+                break
+            for message in received:
+                messages[message["MessageId"]] = message
+
+        self.make_visible(list(messages.values()))
+        return {
+            "queue_name": config.SQS_DLQ_NAME,
+            "approximate_messages": self.approximate_size(),
+            "messages": [describe_dead_letter(message) for message in messages.values()],
+        }
+
+    def replay_batch(self, messages: list):
+        response = self.sqs.send_message_batch(
+            QueueUrl=self.queue_url,
+            Entries=[
+                {
+                    "Id": str(idx),
+                    "MessageBody": message["Body"],
+                    # Keep the first delivery's ID, so the dedup window still
+                    # recognises a message that was committed before it was
+                    # dead-lettered.
+                    "MessageAttributes": {
+                        ORIGINAL_MESSAGE_ID_ATTRIBUTE: {
+                            "DataType": "String",
+                            "StringValue": original_message_id(message),
+                        }
+                    },
+                }
+                for idx, message in enumerate(messages)
+            ],
+        )
+
+        sent = [messages[int(entry["Id"])] for entry in response.get("Successful", [])]
+        failed = [messages[int(entry["Id"])] for entry in response.get("Failed", [])]
+        for entry in response.get("Failed", []):
+            write_log(
+                f"[DLQ ERROR] Failed to replay message {original_message_id(messages[int(entry['Id'])])}: {entry.get('Code')} {entry.get('Message', '')}",
+                level="ERROR",
+            )
+
+        if sent:
+            self.sqs.delete_message_batch(
+                QueueUrl=self.dlq_url,
+                Entries=[
+                    {"Id": str(idx), "ReceiptHandle": message["ReceiptHandle"]}
+                    for idx, message in enumerate(sent)
+                ],
+            )
+        if failed:
+            self.make_visible(failed)
+        return len(sent), len(failed)
+
+    def replay(self, limit: int = 100):
+        # Moves up to `limit` dead letters back onto the orders queue, where
+        # they start over with a fresh receive count.
+        self.connect()
+        replayed = 0
+        failed = 0
+        while replayed + failed < limit:
+            messages = self.receive(limit - replayed - failed)
+            if not messages:
+                break
+            sent_count, failed_count = self.replay_batch(messages)
+            replayed += sent_count
+            failed += failed_count
+            if failed_count and not sent_count:
+                break
+
+        if replayed:
+            write_log(f"[DLQ] Replayed {replayed} messages onto {config.SQS_QUEUE_NAME}")
+        return {
+            "replayed": replayed,
+            "failed": failed,
+            "approximate_messages": self.approximate_size(),
+        }
+
+
+dead_letter_queue = DeadLetterQueue()
@@ -0,0 +1,210 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+
+from config import config
+from fastapi.concurrency import run_in_threadpool
+from logger import write_log
+from producer import producer
+
+# Paced jobs send the orders due in the next tick as one chunk, but never
+# fewer than a full SendMessageBatch so batches aren't sent half-empty.
+PRODUCE_JOB_TICK_SECONDS = 0.1
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+JOB_FINISHED = (JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED)
+
+
+class BackgroundJob:
+    # Status, timing and change notification shared by the API's background
+    # jobs. Subclasses do their work in execute() and describe their progress
+    # in progress(); every change wakes the progress streams.
+    label = "JOB"
+
+    def __init__(self):
+        self.job_id = uuid.uuid4().hex
+        self.status = JOB_PENDING
+        self.last_error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.task = None
+        self.version = 0
+        self.changed = asyncio.Condition()
+
+    @property
+    def finished(self):
+        return self.status in JOB_FINISHED
+
+    def progress(self, elapsed: float):
+        return {}
+
+    def snapshot(self):
+        elapsed = None
+        if self.started_at:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            **self.progress(elapsed),
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "elapsed_seconds": round(elapsed, 3) if elapsed is not None else None,
+            "last_error": self.last_error,
+        }
+
+    async def notify(self):
+        async with self.changed:
+            self.version += 1
+            self.changed.notify_all()
+
+    async def execute(self):
+        raise NotImplementedError
+
+    async def run(self):
+        self.status = JOB_RUNNING
+        self.started_at = time.time()
+        await self.notify()
+        try:
+            await self.execute()
+            self.status = JOB_COMPLETED
+        except asyncio.CancelledError:
+            self.status = JOB_CANCELLED
+        except Exception as e:
+            self.status = JOB_FAILED
+            self.last_error = str(e)
+            write_log(
+                f"[{self.label} ERROR] Job {self.job_id} failed: {e}", level="ERROR"
+            )
+        finally:
+            self.finished_at = time.time()
+            await self.notify()
+
+    async def updates(self):
+        # Yields a snapshot for every change until the job has finished.
+        # Snapshots are coalesced, so a slow reader only skips intermediate
+        # progress, never the final state.
+        seen = -1
+        while True:
+            async with self.changed:
+                await self.changed.wait_for(lambda: self.version != seen)
+                seen = self.version
+            snapshot = self.snapshot()
+            yield snapshot
+            if self.finished:
+                return
+
+
+class ProduceJob(BackgroundJob):
+    # Generates and sends `count` random orders at `rate` orders/sec (0 for
+    # as fast as the producer goes). Only counters are kept, so memory does
+    # not grow with the count.
+    label = "PRODUCE JOB"
+
+    def __init__(self, count: int, rate: float):
+        super().__init__()
+        self.count = count
+        self.rate = rate
+        self.sent = 0
+        self.failed = 0
+
+    def chunk_size(self, elapsed: float):
+        done = self.sent + self.failed
+        batch = max(1, config.PRODUCER_BATCH_SIZE)
+        largest = min(self.count - done, batch * max(1, config.PRODUCER_MAX_WORKERS))
+        if not self.rate:
+            return largest
+        # A job that fell behind (slow sends) catches up with a larger chunk,
+        # which the producer sends as concurrent batches.
+        due = int(self.rate * (elapsed + PRODUCE_JOB_TICK_SECONDS)) - done
+        return min(largest, max(batch, due))
+
+    def progress(self, elapsed: float):
+        return {
+            "count": self.count,
+            "rate": self.rate,
+            "sent": self.sent,
+            "failed": self.failed,
+            "orders_per_second": round((self.sent + self.failed) / elapsed, 1)
+            if elapsed
+            else None,
+        }
+
+    async def send_chunk(self, size: int):
+        sent_orders = await run_in_threadpool(producer.send_orders_to_queue, size)
+        for order in sent_orders:
+            if order["status"] == "sent":
+                self.sent += 1
+            else:
+                self.failed += 1
+                self.last_error = order["error"]
+
+    async def execute(self):
+        started = time.monotonic()
+        while self.sent + self.failed < self.count:
+            await self.send_chunk(self.chunk_size(time.monotonic() - started))
+            await self.notify()
+            if self.rate:
+                ahead = (self.sent + self.failed) / self.rate - (
+                    time.monotonic() - started
+                )
+                if ahead > 0:
+                    await asyncio.sleep(ahead)
+
+
+class JobRegistry:
+    # Registry of one kind of background job in the API process. Running
+    # jobs are capped at `max_running` and the last `history` jobs are kept
+    # for status queries.
+    def __init__(self, name: str, max_running: int, history: int):
+        self.name = name
+        self.max_running = max_running
+        self.history = history
+        self.jobs = OrderedDict()
+
+    def running(self):
+        return [job for job in self.jobs.values() if not job.finished]
+
+    def start(self, job: BackgroundJob):
+        if len(self.running()) >= self.max_running:
+            raise RuntimeError(
+                f"Too many {self.name} jobs running (limit {self.max_running})"
+            )
+
+        self.jobs[job.job_id] = job
+        job.task = asyncio.create_task(job.run())
+        self.trim()
+        return job
+
+    def trim(self):
+        for job_id in list(self.jobs):
+            if len(self.jobs) <= self.history:
+                break
+            if self.jobs[job_id].finished:
+                del self.jobs[job_id]
+
+    def get(self, job_id: str):
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str):
+        job = self.jobs.get(job_id)
+        if job and job.task and not job.finished:
+            job.task.cancel()
+        return job
+
+    async def shutdown(self):
+        tasks = [job.task for job in self.running() if job.task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+produce_jobs = JobRegistry(
+    "produce", config.PRODUCE_JOB_MAX_RUNNING, config.PRODUCE_JOB_HISTORY
+)
@@ -1,37 +1,311 @@
+import atexit
+import fcntl
 import json
-from datetime import datetime
+import os
+import threading
+from datetime import datetime, timedelta
 from pathlib import Path
 
+from config import config
+
 LOG_FILE = Path("consumer_logs.jsonl")
+LOCK_FILE = Path("consumer_logs.jsonl.lock")
+LOG_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class BufferedLogWriter:
+    # Entries are buffered in memory and written by a background thread once
+    # LOG_BUFFER_SIZE entries are pending or every LOG_FLUSH_INTERVAL_MS.
+    # Writes and size-based rotation happen under an exclusive flock, so every
+    # consumer process can share the same file.
+    def __init__(self, path: Path, lock_path: Path):
+        self.path = path
+        self.lock_path = lock_path
+        self.buffer_size = config.LOG_BUFFER_SIZE
+        self.flush_interval = config.LOG_FLUSH_INTERVAL_MS / 1000
+        self.max_bytes = config.LOG_MAX_BYTES
+        self.backup_count = config.LOG_BACKUP_COUNT
+        self.reset()
+
+    def reset(self):
+        self.lock = threading.Lock()
+        self.buffer = []
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.pid = None
+
+    def ensure_started(self):
+        if self.pid == os.getpid():
+            return
+        self.pid = os.getpid()
+        self.thread = threading.Thread(
+            target=self.run, name="buffered-log-writer", daemon=True
+        )
+        self.thread.start()
 
+    def write(self, entry: dict):
+        self.ensure_started()
+        with self.lock:
+            self.buffer.append(entry)
+            pending = len(self.buffer)
+        if pending >= self.buffer_size:
+            self.wakeup.set()
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"Failed to flush consumer logs: {e}")
+
+    def flush(self):
+        with self.lock:
+            entries, self.buffer = self.buffer, []
+        if not entries:
+            return
+
+        data = "".join(json.dumps(entry) + "\n" for entry in entries).encode("utf-8")
+        with open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self.rotate(len(data))
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, data)
+                finally:
+                    os.close(fd)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def rotate(self, incoming_bytes: int):
+        if self.max_bytes <= 0:
+            return
+        try:
+            size = self.path.stat().st_size
+        except FileNotFoundError:
+            return
+        if size == 0 or size + incoming_bytes <= self.max_bytes:
+            return
 
-def write_log(message: str):
+        if self.backup_count <= 0:
+            self.path.unlink()
+            return
+        for index in range(self.backup_count - 1, 0, -1):
+            source = backup_path(index)
+            if source.exists():
+                os.replace(source, backup_path(index + 1))
+        os.replace(self.path, backup_path(1))
+
+    def clear(self):
+        with self.lock:
+            self.buffer = []
+
+
+def backup_path(index: int):
+    return LOG_FILE.with_name(f"{LOG_FILE.name}.{index}")
+
+
+log_writer = BufferedLogWriter(LOG_FILE, LOCK_FILE)
+# A forked consumer must not inherit the parent's pending entries or its
+# (now dead) flusher thread.
+os.register_at_fork(after_in_child=log_writer.reset)
+atexit.register(log_writer.flush)
+
+
+def write_log(message: str, level: str = "INFO", **fields):
     log_entry = {
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "timestamp": datetime.now().strftime(LOG_TIMESTAMP_FORMAT),
+        "level": level,
         "message": message,
     }
-    with open(LOG_FILE, "a") as f:
-        f.write(json.dumps(log_entry) + "\n")
+    log_entry.update(fields)
+    log_writer.write(log_entry)
+
+
+def flush_logs():
+    log_writer.flush()
 
 
-def read_last_n_logs(n: int = 100):
-    if not LOG_FILE.exists():
-        return []
+def log_file_path(index: int):
+    return LOG_FILE if index == 0 else backup_path(index)
 
-    with open(LOG_FILE, "r") as f:
-        lines = f.readlines()
 
-    last_lines = lines[-n:] if len(lines) > n else lines
-    logs = []
-    for line in last_lines:
+def parse_log_cursor(cursor: str):
+    file_index, offset, inode = cursor.split(":", 2)
+    file_index, offset, inode = int(file_index), int(offset), int(inode, 16)
+    if file_index < 0 or offset < 0 or inode < 0:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return file_index, offset, inode
+
+
+def parse_log_time(value: str):
+    return datetime.strptime(value, LOG_TIMESTAMP_FORMAT)
+
+
+def open_log_file(index: int):
+    # Returns the open file and its stat, or None if it does not exist. Both
+    # are taken under the writers' lock, so the size never lands inside a
+    # flush and the file read is the one that was measured even if it is
+    # rotated right after.
+    with open(LOCK_FILE, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_SH)
         try:
-            logs.append(json.loads(line.strip()))
-        except json.JSONDecodeError:
-            continue
+            f = open(log_file_path(index), "rb")
+        except FileNotFoundError:
+            return None
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+    return f, os.fstat(f.fileno())
+
+
+def iter_lines_reversed(f, end_offset: int):
+    # Walks the file backwards from end_offset in LOG_READ_BLOCK_SIZE blocks,
+    # yielding (line_start_offset, line) pairs, newest first.
+    position = end_offset
+    remainder = b""
+    while position > 0:
+        read_size = min(config.LOG_READ_BLOCK_SIZE, position)
+        position -= read_size
+        f.seek(position)
+        lines = (f.read(read_size) + remainder).split(b"\n")
+        remainder = lines[0]
+
+        line_offsets = []
+        offset = position + len(remainder) + 1
+        for line in lines[1:]:
+            line_offsets.append((offset, line))
+            offset += len(line) + 1
+
+        for line_offset, line in reversed(line_offsets):
+            if line:
+                yield line_offset, line
+
+    if remainder:
+        yield 0, remainder
+
+
+class LogTailReader:
+    # Reads consumer logs newest first without loading the file. The cursor
+    # is "<file index>:<byte offset>:<inode>", where file index 0 is the live
+    # log and 1..LOG_BACKUP_COUNT are rotated backups. Rotation renames files,
+    # so a cursor whose file has moved is followed to its new index by inode,
+    # and one whose file has been rotated away ends the listing. A page stops
+    # after `limit` matches or LOG_READ_MAX_SCAN_BYTES scanned, whichever
+    # comes first, and next_cursor resumes where it stopped.
+    def __init__(
+        self,
+        limit: int = 100,
+        cursor: str = None,
+        level: str = None,
+        user_id: str = None,
+        order_id: str = None,
+        since: datetime = None,
+        until: datetime = None,
+    ):
+        self.limit = limit
+        self.file_index, self.end_offset, self.inode = (
+            parse_log_cursor(cursor) if cursor else (0, None, None)
+        )
+        self.level = level.upper() if level else None
+        self.user_id = user_id
+        self.order_id = order_id
+        self.since = since.strftime(LOG_TIMESTAMP_FORMAT) if since else None
+        self.until = until.strftime(LOG_TIMESTAMP_FORMAT) if until else None
+        # Processes flush their buffered entries up to LOG_FLUSH_INTERVAL_MS
+        # after writing them, and timestamps are truncated to the second, so
+        # the file is only in time order up to that much. Nothing older than
+        # this can be followed by an entry inside the range.
+        self.scan_until = None
+        if since:
+            self.scan_until = (
+                since
+                - timedelta(milliseconds=config.LOG_FLUSH_INTERVAL_MS, seconds=1)
+            ).strftime(LOG_TIMESTAMP_FORMAT)
+        self.next_cursor = None
+
+    def prefilter(self, line: bytes):
+        if self.user_id and self.user_id.encode("utf-8") not in line:
+            return False
+        if self.order_id and self.order_id.encode("utf-8") not in line:
+            return False
+        return True
+
+    def matches(self, entry: dict):
+        if self.level and entry.get("level") != self.level:
+            return False
+        if self.user_id and entry.get("user_id") != self.user_id:
+            return False
+        if self.order_id and entry.get("order_id") != self.order_id:
+            return False
+        if self.until and entry.get("timestamp", "") > self.until:
+            return False
+        return True
+
+    def log_files(self):
+        # Yields (index, file, stat, end offset) for every log file to read,
+        # newest first. The live log may be missing, and backups stop at the
+        # first missing one.
+        end_offset = self.end_offset
+        for file_index in range(self.file_index, config.LOG_BACKUP_COUNT + 1):
+            opened = open_log_file(file_index)
+            if opened is None:
+                if file_index == 0:
+                    continue
+                return
+            f, stat = opened
+            with f:
+                if self.inode is not None:
+                    # Still looking for the cursor's file.
+                    if stat.st_ino != self.inode:
+                        continue
+                    self.inode = None
+                    yield file_index, f, stat, min(end_offset, stat.st_size)
+                else:
+                    yield file_index, f, stat, stat.st_size
+
+    def __iter__(self):
+        files = self.log_files()
+        try:
+            yield from self.read(files)
+        finally:
+            # Closes the file a page stopped in.
+            files.close()
+
+    def read(self, files):
+        matched = 0
+        scanned = 0
+
+        for file_index, f, stat, end_offset in files:
+            for line_offset, line in iter_lines_reversed(f, end_offset):
+                if matched >= self.limit or scanned >= config.LOG_READ_MAX_SCAN_BYTES:
+                    self.next_cursor = (
+                        f"{file_index}:{line_offset + len(line) + 1}:{stat.st_ino:x}"
+                    )
+                    return
+                scanned += len(line) + 1
+
+                if not self.prefilter(line) and not self.since:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
 
-    return logs
+                timestamp = entry.get("timestamp", "")
+                if self.since and timestamp < self.since:
+                    if timestamp < self.scan_until:
+                        return
+                    continue
+                if self.prefilter(line) and self.matches(entry):
+                    matched += 1
+                    yield entry
 
 
 def clear_logs():
+    log_writer.clear()
+    for index in range(config.LOG_BACKUP_COUNT, 0, -1):
+        backup_path(index).unlink(missing_ok=True)
     if LOG_FILE.exists():
         LOG_FILE.unlink()
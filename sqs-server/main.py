@@ -1,32 +1,79 @@
+import asyncio
 from contextlib import asynccontextmanager
-from multiprocessing import Process
-from typing import Optional
 
 import uvicorn
 from api import api_router
-from consumer import consumer
+from backfill import backfill_monthly_indexes
+from cache import listen_for_invalidations
+from dlq import dead_letter_queue
 from fastapi import FastAPI
-from logger import clear_logs
+from fastapi.concurrency import run_in_threadpool
+from jobs import produce_jobs
+from logger import clear_logs, flush_logs, write_log
+from metrics import RequestLatencyMiddleware, clear_stale_samples
+from redis_pool import close_async_pool, get_redis, open_async_pool
+from replay import replay_jobs
 from config import config
+from supervisor import supervisor
 
-consumer_process: Optional[Process] = None
+
+async def connect_sqs():
+    try:
+        await run_in_threadpool(dead_letter_queue.connect)
+        return True
+    except Exception as e:
+        write_log(f"[STARTUP ERROR] Failed to connect to SQS: {e}", level="ERROR")
+        return False
+
+
+async def start_consumers():
+    # The SQS client and queue URLs are resolved before the workers fork, so
+    # each worker inherits boto3's loaded service model and the URLs instead
+    # of paying for both. This runs after startup: the API answers liveness
+    # probes right away and readiness once SQS is connected and the workers
+    # are up. If SQS is not reachable yet, the workers provision it
+    # themselves as they restart, and the API keeps retrying with the same
+    # backoff.
+    connected = await connect_sqs()
+    try:
+        # Before the workers start, so no month gets new writes before it
+        # has been indexed.
+        await run_in_threadpool(backfill_monthly_indexes, get_redis())
+    except Exception as e:
+        write_log(
+            f"[STARTUP ERROR] Failed to backfill monthly indexes: {e}", level="ERROR"
+        )
+    supervisor.start()
+    print(
+        f"SQS Consumer pool started ({len(supervisor.workers)} workers, {config.CONSUMER_MODE} mode)"
+    )
+    delay = config.CONSUMER_RESTART_BACKOFF_SECONDS
+    while not connected:
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, config.CONSUMER_RESTART_BACKOFF_MAX_SECONDS)
+        connected = await connect_sqs()
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     clear_logs()
-    global consumer_process
-    consumer_process = Process(target=consumer.start)
-    consumer_process.start()
-    print("SQS Consumer process started")
+    clear_stale_samples()
+    open_async_pool()
+    invalidation_listener = asyncio.create_task(listen_for_invalidations())
+    consumers_started = asyncio.create_task(start_consumers())
     yield
-    if consumer_process and consumer_process.is_alive():
-        consumer_process.terminate()
-        consumer_process.join()
-        print("SQS Consumer process terminated")
+    await produce_jobs.shutdown()
+    await replay_jobs.shutdown()
+    consumers_started.cancel()
+    supervisor.stop()
+    invalidation_listener.cancel()
+    flush_logs()
+    await close_async_pool()
+    print("SQS Consumer pool stopped")
 
 
 app = FastAPI(title="SQS Order Management API", version="1.0.0", lifespan=lifespan)
+app.add_middleware(RequestLatencyMiddleware)
 app.include_router(api_router)
 
 if __name__ == "__main__":
@@ -0,0 +1,256 @@
+import os
+import time
+from pathlib import Path
+
+from config import config
+from logger import write_log
+
+# prometheus_client picks its value backend when it is imported, so the
+# multiprocess directory has to be in the environment first. Consumer worker
+# processes inherit it and write their samples next to the API's, and
+# /metrics sums them. Importing never deletes anything; the server clears
+# the samples of earlier runs with clear_stale_samples on startup.
+os.environ["PROMETHEUS_MULTIPROC_DIR"] = config.PROMETHEUS_MULTIPROC_DIR
+os.makedirs(config.PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+
+from prometheus_client import (  # noqa: E402
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.core import GaugeMetricFamily  # noqa: E402
+from prometheus_client.multiprocess import (  # noqa: E402
+    MultiProcessCollector,
+    mark_process_dead,
+)
+from prometheus_client.registry import Collector  # noqa: E402
+
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    20,
+)
+FILL_RATIO_BUCKETS = (0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1)
+
+SQS_REQUESTS = Counter("sqs_requests", "SQS API calls", ["operation"])
+SQS_ERRORS = Counter(
+    "sqs_errors", "SQS API calls that raised or returned an error", ["operation"]
+)
+SQS_BATCH_ENTRY_FAILURES = Counter(
+    "sqs_batch_entry_failures",
+    "Entries reported as Failed by successful SQS batch calls",
+    ["operation"],
+)
+SQS_RECEIVE_SECONDS = Histogram(
+    "sqs_receive_seconds",
+    "ReceiveMessage latency, long-poll wait included",
+    buckets=LATENCY_BUCKETS,
+)
+SQS_RECEIVE_FILL_RATIO = Histogram(
+    "sqs_receive_batch_fill_ratio",
+    "Messages received per ReceiveMessage call over MaxNumberOfMessages",
+    buckets=FILL_RATIO_BUCKETS,
+)
+SQS_OLDEST_MESSAGE_AGE = Gauge(
+    "sqs_oldest_message_age_seconds",
+    "Age of the oldest message in the latest received batch of each consumer",
+    multiprocess_mode="livemax",
+)
+CONSUMER_STAGE_SECONDS = Histogram(
+    "consumer_stage_seconds",
+    "Time spent per received batch in each consumer stage",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+REDIS_PIPELINE_SECONDS = Histogram(
+    "redis_pipeline_seconds",
+    "Dedup check and MULTI/EXEC commit of a batch, WATCH retries included",
+    buckets=LATENCY_BUCKETS,
+)
+REDIS_WATCH_RETRIES = Counter(
+    "redis_watch_retries", "Batch commits aborted by a concurrent dedup key change"
+)
+CONSUMER_POLL_RECEIVERS = Gauge(
+    "consumer_poll_receivers",
+    "Receives kept in flight, summed over consumer workers",
+    multiprocess_mode="livesum",
+)
+CONSUMER_POLL_WAIT_SECONDS = Gauge(
+    "consumer_poll_wait_seconds",
+    "Long-poll wait of the next receive, the longest over consumer workers",
+    multiprocess_mode="livemax",
+)
+REDIS_POOL_CONNECTIONS = Gauge(
+    "redis_pool_connections",
+    "Connections of each process's Redis pools, checked out or idle",
+    ["pool", "state"],
+    multiprocess_mode="liveall",
+)
+CONSUMER_POLL_DECISIONS = Counter(
+    "consumer_poll_decisions",
+    "Adaptive polling changes to the wait time and number of receivers",
+    ["decision"],
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "API request latency",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+
+PARSE_STAGE = CONSUMER_STAGE_SECONDS.labels(stage="parse")
+COMMIT_STAGE = CONSUMER_STAGE_SECONDS.labels(stage="commit")
+ACK_STAGE = CONSUMER_STAGE_SECONDS.labels(stage="ack")
+
+QUEUE_ATTRIBUTES = {
+    "ApproximateNumberOfMessages": "visible",
+    "ApproximateNumberOfMessagesNotVisible": "in_flight",
+    "ApproximateNumberOfMessagesDelayed": "delayed",
+}
+
+
+def sqs_operation(event_name: str):
+    return event_name.rsplit(".", 1)[-1]
+
+
+def count_sqs_call(event_name: str, http_response=None, parsed=None, **kwargs):
+    operation = sqs_operation(event_name)
+    SQS_REQUESTS.labels(operation).inc()
+    if http_response is not None and http_response.status_code >= 300:
+        SQS_ERRORS.labels(operation).inc()
+    elif parsed and parsed.get("Failed"):
+        SQS_BATCH_ENTRY_FAILURES.labels(operation).inc(len(parsed["Failed"]))
+
+
+def count_sqs_error(event_name: str, **kwargs):
+    operation = sqs_operation(event_name)
+    SQS_REQUESTS.labels(operation).inc()
+    SQS_ERRORS.labels(operation).inc()
+
+
+def instrument_sqs_client(sqs):
+    # botocore fires these once per API call, after its own retries, so every
+    # SQS call in the process is counted without wrapping each call site.
+    sqs.meta.events.register("after-call.sqs", count_sqs_call)
+    sqs.meta.events.register("after-call-error.sqs", count_sqs_error)
+    return sqs
+
+
+def record_receive(seconds: float, messages: list, max_messages: int):
+    SQS_RECEIVE_SECONDS.observe(seconds)
+    SQS_RECEIVE_FILL_RATIO.observe(len(messages) / max_messages if max_messages else 0)
+
+    sent_timestamps = [
+        int(message["Attributes"]["SentTimestamp"])
+        for message in messages
+        if "SentTimestamp" in message.get("Attributes", {})
+    ]
+    if sent_timestamps:
+        SQS_OLDEST_MESSAGE_AGE.set(max(0, time.time() - min(sent_timestamps) / 1000))
+    else:
+        SQS_OLDEST_MESSAGE_AGE.set(0)
+
+
+def process_alive(pid: int):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def clear_stale_samples():
+    # Deletes the sample files (<type>_<pid>.db) of processes that are no
+    # longer running, so the server's counters start from zero, while a live
+    # process sharing the directory keeps its samples. Called by the server
+    # before it forks its consumer workers.
+    for path in Path(config.PROMETHEUS_MULTIPROC_DIR).glob("*.db"):
+        pid = path.stem.rsplit("_", 1)[-1]
+        if pid.isdigit() and int(pid) != os.getpid() and not process_alive(int(pid)):
+            path.unlink(missing_ok=True)
+
+
+def mark_worker_dead(pid: int):
+    # Drops the exited worker from the live* gauges; its counters and
+    # histograms stay in the totals.
+    if pid:
+        mark_process_dead(pid)
+
+
+class QueueDepthCollector(Collector):
+    # Reads queue depths with GetQueueAttributes at scrape time, so the
+    # numbers are never older than the scrape and nothing polls SQS between
+    # scrapes.
+    def __init__(self, queue_depths):
+        self.queue_depths = queue_depths
+
+    def collect(self):
+        depth = GaugeMetricFamily(
+            "sqs_queue_messages",
+            "Approximate number of messages per queue and state",
+            labels=["queue", "state"],
+        )
+        try:
+            queues = self.queue_depths()
+        except Exception as e:
+            write_log(
+                f"[METRICS ERROR] Failed to read queue depth: {e}", level="WARNING"
+            )
+            return
+
+        for queue, attributes in queues.items():
+            for attribute, state in QUEUE_ATTRIBUTES.items():
+                depth.add_metric([queue, state], int(attributes.get(attribute, 0)))
+        yield depth
+
+
+def render_metrics(*collectors):
+    registry = CollectorRegistry()
+    MultiProcessCollector(registry)
+    for collector in collectors:
+        registry.register(collector)
+    return generate_latest(registry)
+
+
+class RequestLatencyMiddleware:
+    # Plain ASGI middleware: streamed responses are timed up to their last
+    # chunk, and no extra task is spawned per request. Requests are labelled
+    # with their route template so path parameters don't add series.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.labels(
+                scope["method"], route.path if route else "unmatched", status[0]
+            ).observe(time.perf_counter() - started)
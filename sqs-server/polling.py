@@ -0,0 +1,111 @@
+from config import config
+from metrics import (
+    CONSUMER_POLL_DECISIONS,
+    CONSUMER_POLL_RECEIVERS,
+    CONSUMER_POLL_WAIT_SECONDS,
+)
+
+# SQS caps a long poll at 20 seconds.
+SQS_WAIT_TIME_LIMIT = 20
+# Weight of the newest sample in the moving averages.
+POLL_SMOOTHING = 0.2
+# Receives coming back this full mean SQS had more than a batch ready.
+POLL_BACKLOG_FILL_RATIO = 0.9
+
+
+def moving_average(current, sample: float):
+    if current is None:
+        return sample
+    return current + POLL_SMOOTHING * (sample - current)
+
+
+class AdaptivePoller:
+    # Picks the long-poll wait and how many receives a consumer keeps in
+    # flight. Every empty receive doubles the wait, from SQS_WAIT_TIME_SECONDS
+    # up to SQS_MAX_WAIT_TIME_SECONDS, so an idle consumer makes few requests
+    # without sleeping on top of its long polls, and the first message resets
+    # it. Receivers are added one at a time while receives come back full or
+    # the queue reports a backlog, as long as they deliver batches slower than
+    # the workers process them, and are dropped back to one when idle or when
+    # received batches pile up.
+    def __init__(self, max_receivers: int = 1):
+        self.adaptive = config.SQS_ADAPTIVE_POLLING
+        self.max_receivers = max(1, max_receivers)
+        self.max_messages = config.SQS_MAX_NUMBER_OF_MESSAGES
+        self.base_wait = min(config.SQS_WAIT_TIME_SECONDS, SQS_WAIT_TIME_LIMIT)
+        self.max_wait = max(
+            self.base_wait, min(config.SQS_MAX_WAIT_TIME_SECONDS, SQS_WAIT_TIME_LIMIT)
+        )
+        self.receivers = 1 if self.adaptive else self.max_receivers
+        self.wait_time = self.base_wait
+        self.empty_receives = 0
+        self.fill_ratio = None
+        self.receive_seconds = None
+        self.processing_seconds = None
+        self.queue_depth = None
+        CONSUMER_POLL_RECEIVERS.set(self.receivers)
+        CONSUMER_POLL_WAIT_SECONDS.set(self.wait_time)
+
+    def set_wait(self, wait_time: int, decision: str):
+        if wait_time != self.wait_time:
+            self.wait_time = wait_time
+            CONSUMER_POLL_WAIT_SECONDS.set(wait_time)
+            CONSUMER_POLL_DECISIONS.labels(decision).inc()
+
+    def set_receivers(self, receivers: int, decision: str):
+        self.receivers = receivers
+        CONSUMER_POLL_RECEIVERS.set(receivers)
+        CONSUMER_POLL_DECISIONS.labels(decision).inc()
+        return True
+
+    def record_receive(self, seconds: float, received: int):
+        self.fill_ratio = moving_average(
+            self.fill_ratio, received / self.max_messages if self.max_messages else 0
+        )
+        if received:
+            # Empty receives only measure the long-poll wait.
+            self.receive_seconds = moving_average(self.receive_seconds, seconds)
+            self.empty_receives = 0
+            self.set_wait(self.base_wait, "wait_reset")
+        else:
+            self.empty_receives += 1
+            if self.adaptive:
+                backoff = max(1, self.base_wait) * 2 ** min(self.empty_receives, 5)
+                self.set_wait(min(self.max_wait, backoff), "wait_backoff")
+
+    def record_processing(self, seconds: float):
+        self.processing_seconds = moving_average(self.processing_seconds, seconds)
+
+    def record_depth(self, depth: int):
+        self.queue_depth = depth
+
+    def keeps_up(self, concurrency: int):
+        # Batches per second the receivers deliver against what the workers
+        # process; another receiver only helps while it is lower.
+        if not (self.receive_seconds and self.processing_seconds):
+            return True
+        return (
+            self.receivers / self.receive_seconds
+            < concurrency / self.processing_seconds
+        )
+
+    def adjust_receivers(self, concurrency: int, backed_up: bool):
+        # Returns whether the number of receivers changed.
+        if not self.adaptive or self.max_receivers == 1:
+            return False
+
+        backlog = (self.fill_ratio or 0) >= POLL_BACKLOG_FILL_RATIO or (
+            self.queue_depth or 0
+        ) > self.receivers * self.max_messages
+        idle = self.empty_receives > 0 and not self.queue_depth
+
+        if backed_up or idle:
+            if self.receivers > 1:
+                return self.set_receivers(self.receivers - 1, "scale_down")
+        elif (
+            backlog
+            and self.receivers < self.max_receivers
+            and self.keeps_up(concurrency)
+        ):
+            return self.set_receivers(self.receivers + 1, "scale_up")
+        return False
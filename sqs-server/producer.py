@@ -1,26 +1,32 @@
-import json
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from random import choice, randint, uniform
 
-import boto3
 from config import config
+from dlq import get_queue_urls
+from schema import Order, OrderItem, encode_order
+from sqs_client import get_sqs_client
+
+SQS_BATCH_MAX_ENTRIES = 10
+SQS_BATCH_MAX_BYTES = 256 * 1024
 
 
 class Producer:
+    # Connects on the first send, so importing the API never waits on SQS.
     def __init__(self):
-        self.sqs = boto3.client(
-            "sqs",
-            region_name=config.AWS_REGION,
-            endpoint_url=config.AWS_ENDPOINT_URL,
-            aws_access_key_id=config.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=config.AWS_SECRET_ACCESS_KEY,
-        )
-        self.queue_url = self.get_queue_url()
+        self.sqs = None
+        self.queue_url = None
+
+    def connect(self):
+        if not self.sqs:
+            self.sqs = get_sqs_client(config.PRODUCER_MAX_WORKERS)
+        if not self.queue_url:
+            self.queue_url = self.get_queue_url()
 
     def get_queue_url(self):
         try:
-            response = self.sqs.create_queue(QueueName=config.SQS_QUEUE_NAME)
-            return response["QueueUrl"]
+            queue_url, _ = get_queue_urls(self.sqs)
+            return queue_url
         except Exception as e:
             raise Exception(f"Failed to get queue URL: {e}")
 
@@ -55,11 +61,9 @@ class Producer:
             quantity = randint(1, 100)
             price = round(uniform(*product["price"]), 2)
             items.append(
-                {
-                    "product_id": product["id"],
-                    "quantity": quantity,
-                    "price_per_unit": price,
-                }
+                OrderItem(
+                    product_id=product["id"], quantity=quantity, price_per_unit=price
+                )
             )
             total_value += quantity * price
 
@@ -82,31 +86,92 @@ class Producer:
             elif invalid_type == 4:
                 final_order_value = round(total_value * uniform(0.5, 1.5), 2)
 
-        return {
-            "order_id": order_id,
-            "user_id": user_id,
-            "order_timestamp": datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ"),
-            "order_value": final_order_value,
-            "items": items,
-            "shipping_address": choice(addresses),
-            "payment_method": choice(payment_methods),
-        }
+        return Order(
+            order_id=order_id,
+            user_id=user_id,
+            order_timestamp=datetime.now(timezone.utc).replace(microsecond=0),
+            order_value=final_order_value,
+            items=items,
+            shipping_address=choice(addresses),
+            payment_method=choice(payment_methods),
+        )
+
+    def build_batches(self, bodies: list):
+        batch_size = min(max(1, config.PRODUCER_BATCH_SIZE), SQS_BATCH_MAX_ENTRIES)
+        batches = []
+        oversized = []
+        current = []
+        current_bytes = 0
+
+        for idx, body in bodies:
+            body_bytes = len(body.encode("utf-8"))
+            if body_bytes > SQS_BATCH_MAX_BYTES:
+                oversized.append(idx)
+                continue
+
+            if current and (
+                len(current) >= batch_size
+                or current_bytes + body_bytes > SQS_BATCH_MAX_BYTES
+            ):
+                batches.append(current)
+                current = []
+                current_bytes = 0
+
+            current.append((idx, body))
+            current_bytes += body_bytes
+
+        if current:
+            batches.append(current)
+
+        return batches, oversized
+
+    def send_batch(self, batch: list):
+        try:
+            response = self.sqs.send_message_batch(
+                QueueUrl=self.queue_url,
+                Entries=[{"Id": str(idx), "MessageBody": body} for idx, body in batch],
+            )
+        except Exception as e:
+            return {idx: {"error": str(e)} for idx, _ in batch}
+
+        results = {}
+        for entry in response.get("Successful", []):
+            results[int(entry["Id"])] = {"message_id": entry["MessageId"]}
+        for entry in response.get("Failed", []):
+            results[int(entry["Id"])] = {
+                "error": f"{entry.get('Code')}: {entry.get('Message', '')}"
+            }
+        return results
 
     def send_orders_to_queue(self, count: int):
+        self.connect()
+        orders = [self.generate_random_order() for _ in range(count)]
+        batches, oversized = self.build_batches(
+            [(idx, encode_order(order)) for idx, order in enumerate(orders)]
+        )
+
+        results = {
+            idx: {"error": "Message exceeds the 256 KB SQS limit"} for idx in oversized
+        }
+        with ThreadPoolExecutor(max_workers=config.PRODUCER_MAX_WORKERS) as executor:
+            for batch_results in executor.map(self.send_batch, batches):
+                results.update(batch_results)
+
         sent_orders = []
-        for _ in range(count):
-            order = self.generate_random_order()
-            response = self.sqs.send_message(
-                QueueUrl=self.queue_url, MessageBody=json.dumps(order)
-            )
-            sent_orders.append(
-                {
-                    "order_id": order["order_id"],
-                    "user_id": order["user_id"],
-                    "order_value": order["order_value"],
-                    "message_id": response["MessageId"],
-                }
-            )
+        for idx, order in enumerate(orders):
+            result = results.get(idx, {"error": "No result returned for message"})
+            sent_order = {
+                "order_id": order.order_id,
+                "user_id": order.user_id,
+                "order_value": order.order_value,
+            }
+            if "message_id" in result:
+                sent_order["status"] = "sent"
+                sent_order["message_id"] = result["message_id"]
+            else:
+                sent_order["status"] = "failed"
+                sent_order["error"] = result["error"]
+            sent_orders.append(sent_order)
 
         return sent_orders
 
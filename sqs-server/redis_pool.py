@@ -0,0 +1,160 @@
+from config import config
+from metrics import REDIS_POOL_CONNECTIONS
+from redis import ConnectionPool, Redis
+from redis.asyncio import ConnectionPool as AsyncConnectionPool
+from redis.asyncio import Redis as AsyncRedis
+
+sync_pool = None
+async_pool = None
+
+
+class PoolGauges:
+    # Counts checkouts itself instead of reading redis-py's private lists,
+    # and exports them from every process that uses a pool, consumer workers
+    # included, through the multiprocess metrics directory.
+    label = None
+
+    def __init__(self, *args, **kwargs):
+        self.checked_out = set()
+        super().__init__(*args, **kwargs)
+        self.record()
+
+    def reset_checkouts(self):
+        self.checked_out = set()
+        self.record()
+
+    def checked_out_connection(self, connection):
+        self.checked_out.add(connection)
+        self.record()
+
+    def released_connection(self, connection):
+        self.checked_out.discard(connection)
+        self.record()
+
+    def record(self):
+        REDIS_POOL_CONNECTIONS.labels(self.label, "in_use").set(
+            len(self.checked_out)
+        )
+        idle = idle_connections(self)
+        if idle is not None:
+            REDIS_POOL_CONNECTIONS.labels(self.label, "idle").set(idle)
+
+
+class CountingConnectionPool(PoolGauges, ConnectionPool):
+    label = "sync"
+
+    def reset(self):
+        # Also runs in a forked worker, which must not count the parent's
+        # checkouts.
+        super().reset()
+        self.reset_checkouts()
+
+    def get_connection(self, *args, **kwargs):
+        connection = super().get_connection(*args, **kwargs)
+        self.checked_out_connection(connection)
+        return connection
+
+    def release(self, connection):
+        super().release(connection)
+        self.released_connection(connection)
+
+
+class CountingAsyncConnectionPool(PoolGauges, AsyncConnectionPool):
+    label = "async"
+
+    def reset(self):
+        super().reset()
+        self.reset_checkouts()
+
+    async def get_connection(self, *args, **kwargs):
+        connection = await super().get_connection(*args, **kwargs)
+        self.checked_out_connection(connection)
+        return connection
+
+    async def release(self, connection):
+        await super().release(connection)
+        self.released_connection(connection)
+
+
+def pool_kwargs():
+    return {
+        "host": config.REDIS_HOST,
+        "port": config.REDIS_PORT,
+        "db": config.REDIS_DB,
+        "max_connections": config.REDIS_MAX_CONNECTIONS,
+        "socket_timeout": config.REDIS_SOCKET_TIMEOUT,
+        "socket_connect_timeout": config.REDIS_SOCKET_CONNECT_TIMEOUT,
+        "health_check_interval": config.REDIS_HEALTH_CHECK_INTERVAL,
+    }
+
+
+def get_sync_pool():
+    # One pool per process. redis-py discards inherited connections after a
+    # fork, so consumer workers get their own pool on first use.
+    global sync_pool
+    if sync_pool is None:
+        sync_pool = CountingConnectionPool(**pool_kwargs())
+    return sync_pool
+
+
+def get_redis():
+    return Redis(connection_pool=get_sync_pool())
+
+
+def create_async_pool():
+    return CountingAsyncConnectionPool(**pool_kwargs())
+
+
+def open_async_pool():
+    global async_pool
+    if async_pool is None:
+        async_pool = create_async_pool()
+    return async_pool
+
+
+async def close_async_pool():
+    global async_pool
+    if async_pool is not None:
+        await async_pool.disconnect()
+        async_pool = None
+
+
+def get_async_redis():
+    return AsyncRedis(connection_pool=open_async_pool())
+
+
+def idle_connections(pool):
+    # redis-py has no public count of idle connections; None if a redis-py
+    # release renames the private list.
+    available = getattr(pool, "_available_connections", None)
+    return None if available is None else len(available)
+
+
+def in_use_connections(pool):
+    if isinstance(pool, PoolGauges):
+        return len(pool.checked_out)
+    in_use = getattr(pool, "_in_use_connections", None)
+    return None if in_use is None else len(in_use)
+
+
+def describe_pool(pool):
+    if pool is None:
+        return None
+
+    in_use = in_use_connections(pool)
+    idle = idle_connections(pool)
+    return {
+        "max_connections": pool.max_connections,
+        "in_use_connections": in_use,
+        "idle_connections": idle,
+        "utilization": round(in_use / pool.max_connections, 4)
+        if pool.max_connections and in_use is not None
+        else None,
+    }
+
+
+def pool_stats():
+    return {
+        "sync": describe_pool(sync_pool),
+        "async": describe_pool(async_pool),
+    }
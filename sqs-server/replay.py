@@ -0,0 +1,212 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from aggregation import DeltaPipeline
+from archive import list_segments, read_segment
+from config import config
+from consumer import consumer
+from fastapi.concurrency import run_in_threadpool
+from jobs import BackgroundJob, JobRegistry
+from redis_pool import get_async_redis, get_redis
+from schema import decode_archived_order
+from supervisor import supervisor
+
+REPLAY_PROGRESS_INTERVAL_SECONDS = 0.25
+REPLAY_JOB_HISTORY = 20
+REPLAY_DELETE_BATCH_SIZE = 1000
+
+# The keys queue_redis_updates writes, which a replay rebuilds. Dedup keys
+# and anything else in the database are left alone, and sketches are only
+# cleared when the replay rebuilds them.
+REPLAY_KEYS = (
+    "global:stats",
+    "months:list",
+    "user_ranking:total_spend",
+    "user_ranking:total_order_count",
+)
+REPLAY_KEY_PATTERNS = ("user:*", "monthly:*", "rollup:*")
+
+
+def replay_key_patterns():
+    if config.SKETCHES_ENABLED:
+        return REPLAY_KEY_PATTERNS + ("sketch:*",)
+    return REPLAY_KEY_PATTERNS
+
+
+async def has_replay_keys(redis_client):
+    # Every committed batch writes global:stats, so it tells whether the
+    # aggregates are empty.
+    return bool(await redis_client.exists(*REPLAY_KEYS))
+
+
+async def clear_replay_keys(redis_client):
+    await redis_client.unlink(*REPLAY_KEYS)
+    for pattern in replay_key_patterns():
+        batch = []
+        async for key in redis_client.scan_iter(
+            match=pattern, count=REPLAY_DELETE_BATCH_SIZE
+        ):
+            batch.append(key)
+            if len(batch) >= REPLAY_DELETE_BATCH_SIZE:
+                await redis_client.unlink(*batch)
+                batch = []
+        if batch:
+            await redis_client.unlink(*batch)
+
+# Progress counters and the cancel flag shared with the pool's worker
+# processes, set by init_replay_worker when each worker starts.
+replayed_orders = None
+replayed_bytes = None
+replay_cancelled = None
+
+
+def init_replay_worker(orders_counter, bytes_counter, cancelled):
+    global replayed_orders, replayed_bytes, replay_cancelled
+    replayed_orders = orders_counter
+    replayed_bytes = bytes_counter
+    replay_cancelled = cancelled
+
+
+def add_progress(orders: int, bytes_read: int):
+    with replayed_orders.get_lock():
+        replayed_orders.value += orders
+    with replayed_bytes.get_lock():
+        replayed_bytes.value += bytes_read
+
+
+def write_chunk(redis_client, chunk: list):
+    # The chunk goes through the consumer's own queue_redis_updates, so the
+    # rebuilt keys are exactly the ones live consumers write, and
+    # DeltaPipeline merges it down to one command per touched field.
+    deltas = DeltaPipeline()
+    consumer.queue_redis_updates(deltas, chunk)
+    with redis_client.pipeline(transaction=False) as pipe:
+        deltas.apply(pipe)
+        pipe.execute()
+
+
+def replay_segment(path: str, size: int):
+    # Runs in a worker process: streams one segment, folds its orders in
+    # chunks of REPLAY_CHUNK_ORDERS and writes each chunk's aggregates with
+    # one pipeline, until the job is cancelled. Returns the number of orders
+    # replayed.
+    redis_client = get_redis()
+    chunk_size = max(1, config.REPLAY_CHUNK_ORDERS)
+    # Only the sketches read an order's items.
+    with_items = config.SKETCHES_ENABLED
+    chunk = []
+    unreported_bytes = 0
+    total = 0
+
+    for bytes_read, lines in read_segment(path, size):
+        unreported_bytes += bytes_read
+        for line in lines:
+            if not line:
+                continue
+            archived = decode_archived_order(line, with_items)
+            chunk.append((archived.order, archived.failed, None))
+            if len(chunk) >= chunk_size:
+                if replay_cancelled.is_set():
+                    return total
+                write_chunk(redis_client, chunk)
+                add_progress(len(chunk), unreported_bytes)
+                total += len(chunk)
+                chunk = []
+                unreported_bytes = 0
+
+    if replay_cancelled.is_set():
+        return total
+    if chunk:
+        write_chunk(redis_client, chunk)
+    add_progress(len(chunk), unreported_bytes)
+    return total + len(chunk)
+
+
+class ReplayJob(BackgroundJob):
+    # Rebuilds the Redis aggregates from the order archive. Segments are
+    # replayed in parallel by REPLAY_WORKERS processes, and the job polls
+    # their shared counters for progress. The consumer workers are drained
+    # for the whole job, so no commit lands between listing the segments,
+    # clearing and rebuilding. With `clear`, the keys the replay rebuilds are
+    # deleted first; without it, the API only starts a replay into empty
+    # aggregates.
+    label = "REPLAY JOB"
+
+    def __init__(self, clear: bool):
+        super().__init__()
+        self.clear = clear
+        self.segments = 0
+        self.segments_done = 0
+        self.bytes_total = 0
+        self.orders_counter = multiprocessing.Value("q", 0)
+        self.bytes_counter = multiprocessing.Value("q", 0)
+        self.cancelled = multiprocessing.Event()
+
+    def progress(self, elapsed: float):
+        orders = self.orders_counter.value
+        return {
+            "clear": self.clear,
+            "segments": self.segments,
+            "segments_done": self.segments_done,
+            "bytes_total": self.bytes_total,
+            "bytes_read": self.bytes_counter.value,
+            "orders": orders,
+            "orders_per_second": round(orders / elapsed, 1) if elapsed else None,
+        }
+
+    async def execute(self):
+        redis_client = get_async_redis()
+        await run_in_threadpool(supervisor.pause)
+        try:
+            # Checked again now that no consumer can commit.
+            if not self.clear and await has_replay_keys(redis_client):
+                raise RuntimeError(
+                    "Redis already holds aggregates, replaying on top would count the archive twice"
+                )
+            segments = await run_in_threadpool(list_segments)
+            self.segments = len(segments)
+            self.bytes_total = sum(size for _, size in segments)
+            if self.clear:
+                await clear_replay_keys(redis_client)
+            await self.notify()
+
+            if segments:
+                await self.replay(segments)
+        finally:
+            await run_in_threadpool(supervisor.resume)
+        await redis_client.publish(config.STATS_INVALIDATION_CHANNEL, "replay")
+
+    async def replay(self, segments: list):
+        # Forked workers inherit the counters, and the consumer code they
+        # run is already imported.
+        pool = ProcessPoolExecutor(
+            max_workers=max(1, min(config.REPLAY_WORKERS, len(segments))),
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=init_replay_worker,
+            initargs=(self.orders_counter, self.bytes_counter, self.cancelled),
+        )
+        loop = asyncio.get_running_loop()
+        try:
+            pending = {
+                loop.run_in_executor(pool, replay_segment, str(path), size)
+                for path, size in segments
+            }
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=REPLAY_PROGRESS_INTERVAL_SECONDS,
+                    return_when=asyncio.FIRST_EXCEPTION,
+                )
+                for future in done:
+                    future.result()
+                self.segments_done += len(done)
+                await self.notify()
+        finally:
+            # Queued segments are dropped and running ones stop before their
+            # next chunk; the job only finishes once no worker can write anymore.
+            self.cancelled.set()
+            await run_in_threadpool(pool.shutdown, wait=True, cancel_futures=True)
+
+
+replay_jobs = JobRegistry("replay", 1, REPLAY_JOB_HISTORY)
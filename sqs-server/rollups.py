@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta, timezone
+
+from aggregation import OrderTotals
+from config import config
+
+# Bucket labels of every granularity are prefixes of the hour label
+# YYYY-MM-DDTHH, so an order's hour is all the consumer has to format.
+BUCKET_LABEL_LENGTHS = {"hour": 13, "day": 10, "month": 7}
+BUCKET_FORMATS = {"hour": "%Y-%m-%dT%H", "day": "%Y-%m-%d", "month": "%Y-%m"}
+
+# Month buckets are the monthly totals hashes the consumer keeps anyway, so
+# only the finer granularities are written as rollups.
+ROLLUP_GRANULARITIES = tuple(
+    granularity
+    for granularity in ("hour", "day")
+    if granularity in config.ROLLUP_GRANULARITIES.replace(" ", "").split(",")
+)
+ROLLUP_TTLS = {
+    "hour": config.ROLLUP_HOUR_TTL_SECONDS,
+    "day": config.ROLLUP_DAY_TTL_SECONDS,
+}
+
+
+def queryable_granularities():
+    return ROLLUP_GRANULARITIES + ("month",)
+
+
+def hour_bucket(timestamp: datetime):
+    # Formatted by hand, strftime is most of the cost of a large batch.
+    return (
+        f"{timestamp.year:04d}-{timestamp.month:02d}-"
+        f"{timestamp.day:02d}T{timestamp.hour:02d}"
+    )
+
+
+def rollup_key(granularity: str, bucket: str):
+    if granularity == "month":
+        return f"monthly:{bucket}:totals"
+    return f"rollup:{granularity}:{bucket}"
+
+
+def fold_rollups(hourly: dict):
+    # Sums a batch's totals per hour into one OrderTotals per written
+    # (granularity, bucket), so each bucket gets one set of increments.
+    rollups = {}
+    for hour, totals in hourly.items():
+        for granularity in ROLLUP_GRANULARITIES:
+            bucket = hour[: BUCKET_LABEL_LENGTHS[granularity]]
+            folded = rollups.get((granularity, bucket))
+            if folded is None:
+                folded = rollups[(granularity, bucket)] = OrderTotals()
+            folded.merge(totals)
+    return rollups
+
+
+def parse_timestamp(value: str):
+    timestamp = datetime.fromisoformat(value)
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.astimezone(timezone.utc)
+
+
+def floor_bucket(granularity: str, timestamp: datetime):
+    timestamp = timestamp.replace(minute=0, second=0, microsecond=0)
+    if granularity in ("day", "month"):
+        timestamp = timestamp.replace(hour=0)
+    if granularity == "month":
+        timestamp = timestamp.replace(day=1)
+    return timestamp
+
+
+def next_bucket(granularity: str, timestamp: datetime):
+    if granularity == "hour":
+        return timestamp + timedelta(hours=1)
+    if granularity == "day":
+        return timestamp + timedelta(days=1)
+    if timestamp.month == 12:
+        return timestamp.replace(year=timestamp.year + 1, month=1)
+    return timestamp.replace(month=timestamp.month + 1)
+
+
+def bucket_labels(granularity: str, start: datetime, end: datetime):
+    # Every bucket in the range is named up front, so a range query reads
+    # known keys instead of scanning for them.
+    labels = []
+    current = floor_bucket(granularity, start)
+    while current <= end:
+        if len(labels) == config.ROLLUP_MAX_POINTS:
+            raise ValueError(
+                f"Range spans more than {config.ROLLUP_MAX_POINTS} {granularity} buckets"
+            )
+        labels.append(current.strftime(BUCKET_FORMATS[granularity]))
+        current = next_bucket(granularity, current)
+    return labels
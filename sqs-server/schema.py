@@ -1,5 +1,98 @@
-from pydantic import BaseModel
+from datetime import datetime
+from typing import Optional
+
+import msgspec
+from config import config
+from pydantic import BaseModel, Field
 
 
 class ProduceRequest(BaseModel):
     count: int = 10
+
+
+class ProduceJobRequest(BaseModel):
+    count: int = Field(1000, gt=0)
+    # Orders per second, 0 sends as fast as the producer can. Defaults to
+    # PRODUCE_JOB_DEFAULT_RATE.
+    rate: Optional[float] = Field(None, ge=0)
+
+
+class ReplayRequest(BaseModel):
+    # Delete the aggregates before replaying, to rebuild them from the
+    # archive alone. Without it, the replay is refused unless they are
+    # already empty, since it would add the archive on top of them.
+    clear: bool = True
+
+
+class UserStatsRequest(BaseModel):
+    user_ids: list[str] = Field(min_length=1, max_length=config.USER_STATS_MAX_IDS)
+
+
+# Wire format of an order message. Decoding checks types in C, so the
+# consumer only has to apply the business rules in validate_order_data. The
+# IDs and the value may be missing: such an order is still decoded, and
+# validation counts it as failed instead of the message being dropped. Keep
+# field names in sync with messages already queued.
+class OrderItem(msgspec.Struct, gc=False):
+    product_id: str
+    quantity: int
+    price_per_unit: float
+
+
+class Order(msgspec.Struct, gc=False, kw_only=True):
+    order_id: Optional[str] = None
+    user_id: Optional[str] = None
+    order_timestamp: datetime
+    order_value: Optional[float] = None
+    items: list[OrderItem] = []
+    shipping_address: Optional[str] = None
+    payment_method: Optional[str] = None
+
+
+# One line of the order archive: a committed order as it was counted, after
+# validation, with whether it was counted as failed.
+class ArchivedOrder(msgspec.Struct, gc=False):
+    order: Order
+    failed: bool = False
+
+
+# The fields the exact stats are computed from. Replay decodes archive lines
+# into these when no sketch needs the items, which skips building them.
+class OrderSummary(msgspec.Struct, gc=False, kw_only=True):
+    order_id: Optional[str] = None
+    user_id: Optional[str] = None
+    order_timestamp: datetime
+    order_value: Optional[float] = None
+
+
+class ArchivedOrderSummary(msgspec.Struct, gc=False):
+    order: OrderSummary
+    failed: bool = False
+
+
+order_encoder = msgspec.json.Encoder()
+order_decoder = msgspec.json.Decoder(Order)
+archived_order_decoder = msgspec.json.Decoder(ArchivedOrder)
+archived_summary_decoder = msgspec.json.Decoder(ArchivedOrderSummary)
+
+
+def encode_order(order: Order):
+    return order_encoder.encode(order).decode("utf-8")
+
+
+def decode_order(body: str):
+    return order_decoder.decode(body)
+
+
+def encode_archived_orders(orders: list):
+    # NDJSON, one ArchivedOrder per line.
+    return b"".join(
+        order_encoder.encode(ArchivedOrder(order_data, is_failed)) + b"\n"
+        for order_data, is_failed in orders
+    )
+
+
+def decode_archived_order(line: bytes, with_items: bool = True):
+    if with_items:
+        return archived_order_decoder.decode(line)
+    return archived_summary_decoder.decode(line)
@@ -0,0 +1,90 @@
+import hashlib
+import math
+from collections import defaultdict
+from functools import lru_cache
+
+from config import config
+
+# Count-Min sketches are plain hashes with a "row:column" field per cell, and
+# top-K candidates are a sorted set trimmed to SKETCH_TOPK_CAPACITY, so every
+# sketch works on stock Redis and merges like the other counters.
+SKETCH_DIMENSIONS = ("products", "payment_methods")
+
+CMS_WIDTH = max(1, config.SKETCH_CMS_WIDTH)
+CMS_DEPTH = min(max(1, config.SKETCH_CMS_DEPTH), 32)
+
+# Order values are counted in logarithmic buckets, so each estimated quantile
+# is within SKETCH_QUANTILE_ACCURACY of the true value relative to it, and
+# the bucket count only grows with the log of the value range.
+QUANTILE_GAMMA = (1 + config.SKETCH_QUANTILE_ACCURACY) / (
+    1 - config.SKETCH_QUANTILE_ACCURACY
+)
+QUANTILE_LOG_GAMMA = math.log(QUANTILE_GAMMA)
+
+
+def sketch_key(month_key: str, name: str):
+    return f"sketch:{month_key}:{name}"
+
+
+@lru_cache(maxsize=4096)
+def cms_cells(item: str):
+    # One 16-bit slice of a single digest per row.
+    digest = hashlib.blake2b(item.encode("utf-8"), digest_size=2 * CMS_DEPTH).digest()
+    return tuple(
+        f"{row}:{int.from_bytes(digest[2 * row : 2 * row + 2], 'big') % CMS_WIDTH}"
+        for row in range(CMS_DEPTH)
+    )
+
+
+def cms_estimate(cell_counts: list):
+    return min(int(count or 0) for count in cell_counts)
+
+
+def value_bucket(value: float):
+    return math.ceil(math.log(value) / QUANTILE_LOG_GAMMA)
+
+
+def bucket_value(bucket: int):
+    return 2 * QUANTILE_GAMMA**bucket / (QUANTILE_GAMMA + 1)
+
+
+def estimate_quantiles(bucket_counts: dict, quantiles: list):
+    buckets = sorted(
+        (int(bucket), int(count)) for bucket, count in bucket_counts.items()
+    )
+    total = sum(count for _, count in buckets)
+    estimates = {}
+    for quantile in quantiles:
+        if not total:
+            estimates[quantile] = None
+            continue
+        rank = quantile * (total - 1)
+        seen = 0
+        for bucket, count in buckets:
+            seen += count
+            if seen > rank:
+                estimates[quantile] = round(bucket_value(bucket), 2)
+                break
+    return estimates
+
+
+class SketchBatch:
+    # Folds a commit's valid orders per month before anything is queued: the
+    # unique user and order IDs, units per product, orders per payment method
+    # and orders per value bucket.
+    def __init__(self):
+        self.users = defaultdict(set)
+        self.orders = defaultdict(set)
+        self.counts = defaultdict(lambda: defaultdict(int))
+        self.value_buckets = defaultdict(lambda: defaultdict(int))
+
+    def add(self, month_key: str, order_data, order_value: float):
+        self.users[month_key].add(order_data.user_id)
+        self.orders[month_key].add(order_data.order_id)
+        products = self.counts[(month_key, "products")]
+        for item in order_data.items:
+            products[item.product_id] += item.quantity
+        if order_data.payment_method:
+            self.counts[(month_key, "payment_methods")][order_data.payment_method] += 1
+        if order_value > 0:
+            self.value_buckets[month_key][value_bucket(order_value)] += 1
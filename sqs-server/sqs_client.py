@@ -0,0 +1,50 @@
+import os
+import threading
+
+from config import config
+from metrics import instrument_sqs_client
+
+# botocore's default connection pool size.
+SQS_DEFAULT_MAX_POOL_CONNECTIONS = 10
+
+# One client per process and connection pool size, created on first use, so
+# importing the app neither loads boto3 nor touches the network. Clients are
+# not shared across a fork: a forked worker builds its own, but it inherits
+# boto3's default session with the SQS service model the parent already
+# loaded, which makes that several times cheaper than a cold client.
+clients = {}
+clients_lock = threading.Lock()
+
+
+def reset_clients():
+    global clients_lock
+    clients.clear()
+    clients_lock = threading.Lock()
+
+
+def get_sqs_client(max_pool_connections: int = SQS_DEFAULT_MAX_POOL_CONNECTIONS):
+    client = clients.get(max_pool_connections)
+    if client is not None:
+        return client
+
+    with clients_lock:
+        if max_pool_connections not in clients:
+            # boto3 takes about a tenth of a second to import, paid here by
+            # whichever process needs SQS first instead of by every import.
+            import boto3
+            from botocore.config import Config as BotoConfig
+
+            clients[max_pool_connections] = instrument_sqs_client(
+                boto3.client(
+                    "sqs",
+                    region_name=config.AWS_REGION,
+                    endpoint_url=config.AWS_ENDPOINT_URL,
+                    aws_access_key_id=config.AWS_ACCESS_KEY_ID,
+                    aws_secret_access_key=config.AWS_SECRET_ACCESS_KEY,
+                    config=BotoConfig(max_pool_connections=max_pool_connections),
+                )
+            )
+        return clients[max_pool_connections]
+
+
+os.register_at_fork(after_in_child=reset_clients)
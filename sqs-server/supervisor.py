@@ -0,0 +1,214 @@
+import signal
+import threading
+import time
+from multiprocessing import Event, Process, Value
+
+from async_consumer import async_consumer
+from config import config
+from consumer import consumer
+from logger import flush_logs, write_log
+from metrics import mark_worker_dead
+
+
+class WorkerStats:
+    def __init__(self):
+        self.processed_messages = Value("q", 0)
+        self.last_heartbeat = Value("d", 0.0)
+
+    def beat(self):
+        self.last_heartbeat.value = time.time()
+
+    def record(self, count: int):
+        with self.processed_messages.get_lock():
+            self.processed_messages.value += count
+        self.beat()
+
+
+def run_consumer_worker(stop_event, stats: WorkerStats):
+    # The supervisor owns shutdown: ignore the Ctrl+C that reaches the whole
+    # process group and turn SIGTERM into a drain request.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+
+    stats.beat()
+    try:
+        if config.CONSUMER_MODE == "async":
+            async_consumer.start(stop_event, stats)
+        else:
+            consumer.start(stop_event, stats)
+    finally:
+        # multiprocessing children skip atexit handlers.
+        flush_logs()
+
+
+class ConsumerWorker:
+    def __init__(self, index: int):
+        self.index = index
+        self.process = None
+        self.stop_event = None
+        self.stats = WorkerStats()
+        self.started_at = None
+        self.restarts = 0
+        self.last_exit_code = None
+        self.restart_at = None
+        self.last_sample = (time.monotonic(), 0)
+        self.messages_per_second = 0.0
+
+    def spawn(self):
+        self.stop_event = Event()
+        self.process = Process(
+            target=run_consumer_worker,
+            args=(self.stop_event, self.stats),
+            name=f"sqs-consumer-{self.index}",
+        )
+        self.process.start()
+        self.started_at = time.time()
+        self.restart_at = None
+
+    def sample_throughput(self):
+        now = time.monotonic()
+        processed = self.stats.processed_messages.value
+        last_time, last_processed = self.last_sample
+        if now > last_time:
+            self.messages_per_second = (processed - last_processed) / (now - last_time)
+        self.last_sample = (now, processed)
+
+    def status(self):
+        alive = bool(self.process and self.process.is_alive())
+        last_heartbeat = self.stats.last_heartbeat.value
+        return {
+            "worker": self.index,
+            "pid": self.process.pid if self.process else None,
+            "alive": alive,
+            "started_at": self.started_at,
+            "heartbeat_age_seconds": round(time.time() - last_heartbeat, 2)
+            if last_heartbeat
+            else None,
+            "processed_messages": self.stats.processed_messages.value,
+            "messages_per_second": round(self.messages_per_second, 2),
+            "restarts": self.restarts,
+            "last_exit_code": self.last_exit_code,
+        }
+
+
+class ConsumerSupervisor:
+    # Runs CONSUMER_WORKERS consumer processes, restarts crashed workers with
+    # exponential backoff and drains them through their stop events on
+    # shutdown. pause() drains them for jobs that need Redis to themselves;
+    # the lock keeps the monitor from restarting a worker meanwhile.
+    def __init__(self):
+        self.workers = []
+        self.monitor_thread = None
+        self.stopping = threading.Event()
+        self.paused = threading.Event()
+        self.lock = threading.Lock()
+
+    def start(self, size: int = None):
+        size = size or config.CONSUMER_WORKERS
+        self.stopping.clear()
+        with self.lock:
+            self.workers = [ConsumerWorker(index) for index in range(size)]
+            # A pool started while paused is spawned by resume().
+            if not self.paused.is_set():
+                for worker in self.workers:
+                    worker.spawn()
+
+        self.monitor_thread = threading.Thread(
+            target=self.monitor, name="sqs-consumer-supervisor", daemon=True
+        )
+        self.monitor_thread.start()
+
+    def restart_delay(self, worker: ConsumerWorker):
+        return min(
+            config.CONSUMER_RESTART_BACKOFF_SECONDS * 2**worker.restarts,
+            config.CONSUMER_RESTART_BACKOFF_MAX_SECONDS,
+        )
+
+    def check_worker(self, worker: ConsumerWorker):
+        worker.sample_throughput()
+        if worker.process.is_alive():
+            return
+
+        now = time.monotonic()
+        if worker.restart_at is None:
+            worker.last_exit_code = worker.process.exitcode
+            mark_worker_dead(worker.process.pid)
+            # A worker that stayed up for a while is not crash-looping, so
+            # start its backoff from scratch.
+            uptime = time.time() - worker.started_at
+            if uptime > config.CONSUMER_RESTART_BACKOFF_MAX_SECONDS:
+                worker.restarts = 0
+            delay = self.restart_delay(worker)
+            worker.restart_at = now + delay
+            write_log(
+                f"[SUPERVISOR] Consumer worker {worker.index} exited with code {worker.last_exit_code}, restarting in {delay}s",
+                level="ERROR",
+            )
+        elif now >= worker.restart_at:
+            worker.restarts += 1
+            worker.spawn()
+
+    def monitor(self):
+        while not self.stopping.wait(config.CONSUMER_SUPERVISOR_INTERVAL_SECONDS):
+            with self.lock:
+                if self.paused.is_set():
+                    continue
+                for worker in self.workers:
+                    self.check_worker(worker)
+
+    def pause(self):
+        # Blocks until every worker has committed and acked what it received
+        # and exited. Messages still in the queue wait for resume().
+        with self.lock:
+            self.paused.set()
+            self.drain()
+        write_log("[SUPERVISOR] Consumer workers paused")
+
+    def resume(self):
+        with self.lock:
+            if not self.paused.is_set():
+                return
+            self.paused.clear()
+            if self.stopping.is_set():
+                return
+            for worker in self.workers:
+                if not (worker.process and worker.process.is_alive()):
+                    worker.spawn()
+        write_log("[SUPERVISOR] Consumer workers resumed")
+
+    def stop(self):
+        self.stopping.set()
+        if self.monitor_thread:
+            self.monitor_thread.join()
+        with self.lock:
+            self.drain()
+
+    def drain(self):
+        for worker in self.workers:
+            if worker.stop_event:
+                worker.stop_event.set()
+
+        deadline = time.monotonic() + config.CONSUMER_SHUTDOWN_TIMEOUT_SECONDS
+        for worker in self.workers:
+            if worker.process:
+                worker.process.join(max(0, deadline - time.monotonic()))
+
+        for worker in self.workers:
+            if worker.process and worker.process.is_alive():
+                write_log(
+                    f"[SUPERVISOR] Consumer worker {worker.index} did not drain in time, killing",
+                    level="ERROR",
+                )
+                # SIGTERM only requests a drain in the worker, so force it.
+                worker.process.kill()
+                worker.process.join()
+
+        for worker in self.workers:
+            if worker.process:
+                mark_worker_dead(worker.process.pid)
+
+    def status(self):
+        return [worker.status() for worker in self.workers]
+
+
+supervisor = ConsumerSupervisor()
@@ -0,0 +1,190 @@
+import itertools
+import threading
+import time
+
+from config import config
+from logger import write_log
+
+SQS_VISIBILITY_BATCH_LIMIT = 10
+SQS_MAX_VISIBILITY_TIMEOUT = 12 * 60 * 60
+
+
+def receive_count(message: dict):
+    return int(message.get("Attributes", {}).get("ApproximateReceiveCount", 1))
+
+
+def retry_delay(message: dict):
+    # Exponential in the number of times SQS has already delivered the
+    # message, so a failing message backs off instead of coming back every
+    # SQS_VISIBILITY_TIMEOUT until it is redriven to the dead-letter queue.
+    delay = config.SQS_RETRY_BACKOFF_SECONDS * 2 ** (receive_count(message) - 1)
+    return int(
+        min(delay, config.SQS_RETRY_BACKOFF_MAX_SECONDS, SQS_MAX_VISIBILITY_TIMEOUT)
+    )
+
+
+def change_visibility(sqs, queue_url: str, entries: list):
+    # entries are (receipt_handle, visibility_timeout, label) tuples.
+    for offset in range(0, len(entries), SQS_VISIBILITY_BATCH_LIMIT):
+        chunk = entries[offset : offset + SQS_VISIBILITY_BATCH_LIMIT]
+        try:
+            response = sqs.change_message_visibility_batch(
+                QueueUrl=queue_url,
+                Entries=[
+                    {
+                        "Id": str(idx),
+                        "ReceiptHandle": receipt_handle,
+                        "VisibilityTimeout": timeout,
+                    }
+                    for idx, (receipt_handle, timeout, _) in enumerate(chunk)
+                ],
+            )
+            failed = response.get("Failed", [])
+        except Exception as e:
+            failed = [{"Id": str(idx), "Message": str(e)} for idx in range(len(chunk))]
+
+        for failure in failed:
+            _, _, label = chunk[int(failure["Id"])]
+            write_log(
+                f"[VISIBILITY ERROR] {label} Failed to change message visibility: {failure.get('Code', '')} {failure.get('Message', '')}",
+                level="WARNING",
+            )
+
+
+class InFlightBatch:
+    __slots__ = (
+        "receipt_handles",
+        "started_at",
+        "next_extension_at",
+        "expired",
+        "released",
+        "extension",
+    )
+
+    def __init__(self, receipt_handles: list, started_at: float, interval: float):
+        self.receipt_handles = receipt_handles
+        self.started_at = started_at
+        self.next_extension_at = started_at + interval
+        self.expired = False
+        self.released = False
+        # Set while an extension including this batch is being sent; the
+        # event fires once it has landed.
+        self.extension = None
+
+
+class VisibilityHeartbeat:
+    # Extends the visibility timeout of batches that are still being
+    # processed every SQS_VISIBILITY_HEARTBEAT_SECONDS, so a slow batch is not
+    # redelivered to another consumer mid-flight. A batch stuck for longer
+    # than SQS_VISIBILITY_HEARTBEAT_MAX_SECONDS is left to time out. The lock
+    # only guards the bookkeeping: due batches are snapshotted under it and
+    # extended after it is released, so track and release never wait on SQS.
+    def __init__(self, sqs, queue_url: str):
+        self.sqs = sqs
+        self.queue_url = queue_url
+        self.interval = config.SQS_VISIBILITY_HEARTBEAT_SECONDS
+        self.max_seconds = config.SQS_VISIBILITY_HEARTBEAT_MAX_SECONDS
+        self.in_flight = {}
+        self.tokens = itertools.count()
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.interval <= 0 or self.thread:
+            return
+        self.stopping.clear()
+        self.thread = threading.Thread(
+            target=self.run, name="sqs-visibility-heartbeat", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def track(self, messages: list):
+        if not self.thread:
+            return None
+        token = next(self.tokens)
+        batch = InFlightBatch(
+            [message["ReceiptHandle"] for message in messages],
+            time.monotonic(),
+            self.interval,
+        )
+        with self.lock:
+            self.in_flight[token] = batch
+        return token
+
+    def detach(self, token, messages: list = None):
+        # Stops extending the whole batch, or only the given messages of it.
+        # Returns the event of an extension of it that is already being sent,
+        # or None, so the caller can wait for it before it acks or
+        # reschedules those messages.
+        if token is None:
+            return None
+        with self.lock:
+            batch = self.in_flight.get(token)
+            if batch is None:
+                return None
+            if messages is None:
+                batch.released = True
+                del self.in_flight[token]
+            else:
+                detached = {message["ReceiptHandle"] for message in messages}
+                batch.receipt_handles = [
+                    receipt_handle
+                    for receipt_handle in batch.receipt_handles
+                    if receipt_handle not in detached
+                ]
+            return batch.extension
+
+    def release(self, token, messages: list = None):
+        # Blocking form of detach for the sync consumer.
+        extension = self.detach(token, messages)
+        if extension:
+            extension.wait()
+
+    def run(self):
+        while not self.stopping.wait(min(1.0, self.interval)):
+            with self.lock:
+                batches, entries = self.due_extensions()
+                extension = threading.Event()
+                for batch in batches:
+                    batch.extension = extension
+            if not entries:
+                continue
+            try:
+                change_visibility(self.sqs, self.queue_url, entries)
+            finally:
+                with self.lock:
+                    for batch in batches:
+                        batch.extension = None
+                extension.set()
+
+    def due_extensions(self):
+        now = time.monotonic()
+        batches = []
+        entries = []
+        for batch in self.in_flight.values():
+            if batch.released or batch.expired or now < batch.next_extension_at:
+                continue
+            if now - batch.started_at >= self.max_seconds:
+                batch.expired = True
+                write_log(
+                    f"[VISIBILITY] Batch of {len(batch.receipt_handles)} messages still in progress after {self.max_seconds}s, no longer extending visibility",
+                    level="WARNING",
+                )
+                continue
+
+            batch.next_extension_at = now + self.interval
+            if not batch.receipt_handles:
+                continue
+            batches.append(batch)
+            entries += [
+                (receipt_handle, config.SQS_VISIBILITY_TIMEOUT, "[HEARTBEAT]")
+                for receipt_handle in batch.receipt_handles
+            ]
+        return batches, entries